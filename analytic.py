@@ -0,0 +1,51 @@
+"""Exact criteria values without sampling.
+
+Attacks are uniform over the 2^T - 1 non-empty technique subsets and the payoff is additive over
+techniques, a(j, A) = sum over t in A of c_j(t) with c_j(t) = sum over m in j of cost_m * [m covers t]:
+
+  Laplace  E[a(j, A)] = p * sum over t of c_j(t), p = 2^(T-1) / (2^T - 1) is the inclusion probability of t
+  Wald     max over A is the full technique set, sum over t of c_j(t)
+  Savage   max - min over A, the minimum is reached on the cheapest single technique
+"""
+import numpy as np
+
+import profiling
+import simulation
+from criteria import CriteriaReducer
+from projectsharablestate import DefenderCriteria
+
+
+def inclusion_probability(n_techniques):
+    # 2^(T-1) / (2^T - 1) without overflowing for large T
+    return 0.5 / (1 - 2.0 ** -n_techniques)
+
+
+def technique_costs(coverage, costs, strategies):
+    """c_j(t) for every strategy (rows of boolean matrix strategies) and technique, matrix (strategies, techniques)."""
+    return (strategies * np.asarray(costs, dtype=float)) @ coverage.matrix
+
+
+def column_values(coverage, costs, criteria, strategies):
+    per_technique = technique_costs(coverage, costs, strategies)
+    full_attack = per_technique.sum(axis=1)
+    if criteria == DefenderCriteria.LAPLACE_REASON:
+        return np.ma.masked_equal(full_attack, 0) * inclusion_probability(coverage.n_techniques)
+    if criteria == DefenderCriteria.WALD_MAXIMIN:
+        return np.ma.masked_equal(full_attack, 0)
+    if criteria == DefenderCriteria.SAVAGE_MINIMAX:
+        return np.ma.masked_invalid(full_attack - per_technique.min(axis=1))
+    raise RuntimeError("Unknown criteria %s!" % criteria)
+
+
+def analytic_criteria(coverage, costs, criteria, k=3, keep_values=True, progress=None):
+    """Criteria value of every defender strategy in closed form, returned as a CriteriaReducer."""
+    total = simulation.strategies_count(coverage.n_mitigations)
+    reducer = CriteriaReducer(criteria, None, total, k=k, keep_values=keep_values)
+    for start in range(0, total, simulation.COLUMN_CHUNK):
+        stop = min(start + simulation.COLUMN_CHUNK, total)
+        strategies = simulation.strategy_masks(coverage.n_mitigations, start, stop)
+        with profiling.phase("criteria"):
+            reducer.update_values(start, column_values(coverage, costs, criteria, strategies))
+        if progress is not None:
+            progress(stop / total)
+    return reducer
@@ -0,0 +1,177 @@
+"""Headless runner: solve many projects without the UI.
+
+Input files are JSON Lines, one project per line, either a bare `ProjectSettings.to_dict()` or
+
+    {"name": "customer-1", "project": {...ProjectSettings...}, "run": {"algorithm": "Analytic", ...}}
+
+where "run" overrides the command line defaults (algorithm, simulations, b, seed, workers, sampling,
+confidence, top, profile).
+Results are written as JSON Lines in completion order, every result carries the file and line
+of its project. A failing project produces a result with "error" instead of stopping the batch.
+
+    python batch.py projects.jsonl --algorithm Analytic --jobs 4 --output results.jsonl
+"""
+import argparse
+import dataclasses
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from functools import lru_cache
+from multiprocessing import get_context
+
+from projectsharablestate import GameAlgorithm, ProjectSettings, SamplingMode
+
+RUN_OPTIONS = ("algorithm", "simulations", "b", "seed", "workers", "sampling", "confidence", "top", "profile")
+
+
+def read_projects(paths):
+    """Yield (path, line number, line) for every non-empty line of the input files.
+
+    Lines are parsed by the runs (see parse_entry), so a malformed one fails only its own project.
+    """
+    for path in paths:
+        with open(path, encoding="utf-8") as projects:
+            for line_number, line in enumerate(projects, start=1):
+                if line.strip():
+                    yield path, line_number, line
+
+
+def parse_entry(line):
+    """Input entry of one line, a JSON object."""
+    entry = json.loads(line)
+    if not isinstance(entry, dict):
+        raise ValueError(f"Expected a JSON object, got {type(entry).__name__}")
+    return entry
+
+
+@lru_cache(maxsize=None)
+def _source(domain, version, cache_dir, offline):
+    import stixcache
+
+    # One opened bundle per worker process and ATT&CK version
+    return stixcache.get_source(domain, version, cache_dir=cache_dir, offline=offline)
+
+
+def _strategy(game, rank):
+    from maths import CombinationGenerator
+
+    records = CombinationGenerator(game.defender_strategies).unrankVaryingLengthCombination(rank)
+    return [record.external_id for record in records]
+
+
+def run_project(entry, defaults, cache_dir=None, offline=None):
+    """Solve one input entry, returns the JSON-friendly result."""
+    from game import build_game, solve_game
+    from profiling import Profile
+
+    settings = ProjectSettings.from_dict(entry.get("project", entry))
+    options = dict(defaults)
+    options.update(entry.get("run", {}))
+    algorithm = GameAlgorithm[options["algorithm"]]
+
+    profile = Profile(cprofile=options.get("profile") == "cprofile")
+    with profile.activate() if options.get("profile") else nullcontext():
+        game = build_game(_source(settings.mitre_domain, settings.mitre_version, cache_dir, offline), settings)
+        result = solve_game(game, settings.defender_criteria, algorithm, n_simulations=options["simulations"],
+                            b=options["b"], seed=options["seed"], workers=options["workers"],
+                            confidence=options.get("confidence", 0.95), certified_top=options.get("top", 1),
+                            sampling=SamplingMode[options.get("sampling", SamplingMode.Independent.name)])
+
+    output = {
+        "name": entry.get("name"),
+        "algorithm": algorithm.name,
+        "criteria": settings.defender_criteria.name,
+        "techniques": len(game.attacker_strategies),
+        "mitigations": len(game.defender_strategies),
+        "seconds": result.seconds,
+        "top": [{"rank": int(rank), "value": float(value), "mitigations": _strategy(game, rank)}
+                for rank, value in result.top],
+    }
+    if result.equilibrium is not None:
+        output["equilibrium"] = {
+            "value": result.equilibrium.value,
+            "iterations": result.equilibrium.iterations,
+            "gap": result.equilibrium.gap,
+            "defender": [{"probability": p, "mitigations": [game.defender_strategies[i].external_id for i in positions]}
+                         for p, positions in result.equilibrium.defender],
+            "attacker": [{"probability": p, "techniques": [game.attacker_strategies[i].external_id for i in positions]}
+                         for p, positions in result.equilibrium.attacker],
+        }
+    if result.racing is not None:
+        output["racing"] = dataclasses.asdict(result.racing)
+    if options.get("profile"):
+        output["profile"] = profile.to_dict()
+    return output
+
+
+def _run_safely(path, line_number, line, defaults, cache_dir, offline):
+    entry = {}
+    try:
+        entry = parse_entry(line)
+        result = run_project(entry, defaults, cache_dir, offline)
+    except Exception as e:
+        result = {"name": entry.get("name"), "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()}
+    result.update(file=path, line=line_number)
+    return result
+
+
+def run_batch(paths, output, defaults, jobs=1, cache_dir=None, offline=None):
+    """Solve every project of the input files with up to jobs processes, returns the number of failures."""
+    failures = 0
+    entries = read_projects(paths)
+
+    def write(result):
+        nonlocal failures
+        failures += "error" in result
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output.flush()
+
+    if jobs <= 1:
+        for path, line_number, line in entries:
+            write(_run_safely(path, line_number, line, defaults, cache_dir, offline))
+        return failures
+
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=get_context("spawn")) as executor:
+        futures = [executor.submit(_run_safely, path, line_number, line, defaults, cache_dir, offline)
+                   for path, line_number, line in entries]
+        for future in as_completed(futures):
+            write(future.result())
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve game theory security projects without the UI.")
+    parser.add_argument("projects", nargs="+", help="JSON Lines files with one project per line")
+    parser.add_argument("-o", "--output", help="results file (JSON Lines), stdout by default")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="projects solved at once")
+    parser.add_argument("--algorithm", choices=[a.name for a in GameAlgorithm], default=GameAlgorithm.Analytic.name)
+    parser.add_argument("--simulations", type=int, default=10, help="Monte Carlo simulations per strategy")
+    parser.add_argument("--b", type=float, default=1000, help="UCB exploration parameter")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1, help="Monte Carlo processes inside one project")
+    parser.add_argument("--sampling", choices=[s.name for s in SamplingMode], default=SamplingMode.Independent.name,
+                        help="Monte Carlo attacks: own per strategy, or Common / Sobol shared by all strategies")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Racing: confidence of the certified top")
+    parser.add_argument("--top", type=int, default=1, help="Racing: number of best strategies to certify")
+    parser.add_argument("--profile", nargs="?", const="phases", choices=["phases", "cprofile"], default=None,
+                        help="add phase timings and counters to every result, with cProfile statistics too")
+    parser.add_argument("--cache-dir", default=None, help="ATT&CK cache directory, see stixcache")
+    parser.add_argument("--offline", action="store_true", default=None, help="never download ATT&CK data")
+    args = parser.parse_args(argv)
+
+    defaults = {option: getattr(args, option) for option in RUN_OPTIONS}
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        failures = run_batch(args.projects, output, defaults, jobs=args.jobs, cache_dir=args.cache_dir,
+                             offline=args.offline)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
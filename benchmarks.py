@@ -0,0 +1,150 @@
+"""Offline benchmarks on synthetic ATT&CK bundles (see synthetic).
+
+For every size (number of mitigations S, so 2^S - 1 defender strategies) a synthetic bundle is
+cached in a temporary directory and opened through stixcache like the real data. Then it times:
+
+  unrank           CombinationGenerator.unrankVaryingLengthCombination, one rank at a time
+  unrank-batch     CombinationGenerator.unrankVaryingLengthBatch over every rank
+  get-related      mitigation -> techniques mapping, compiled graph of the cache and stix2 MemoryStore
+  build-game       strategy lists and coverage of the project (items are techniques plus mitigations)
+  <algorithm>      every GameAlgorithm with every DefenderCriteria (DoubleOracle has no criteria,
+                   Racing only races the Laplace criterion), Monte Carlo also with common attacks
+
+Each benchmark reports the best time of --repeat runs, the items it processed (ranks, relationships,
+payoff cells, pulls or strategies), throughput and the peak memory of one more run traced by
+tracemalloc, so timings are not slowed down by tracing.
+
+    python benchmarks.py --sizes 8 12 16 --simulations 50 --json bench.json
+"""
+import argparse
+import json
+import math
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import synthetic
+from projectsharablestate import DefenderCriteria, GameAlgorithm, SamplingMode
+
+# Ranks unranked one at a time, the batch benchmark covers all of them
+SINGLE_UNRANKS = 10_000
+
+
+def measure(fn, repeat=3):
+    """(best seconds of repeat calls, peak traced bytes of one more call)."""
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def cases(thesrc, objects, settings, n_simulations, b, seed):
+    """Yield (name, items, callable) of every benchmark for one bundle."""
+    import numpy as np
+    from stix2 import MemoryStore
+
+    import stixlib as sx
+    from game import build_game, solve_game
+    from maths import CombinationGenerator
+    from stixindex import IndexedStore
+
+    game = build_game(thesrc, settings)
+    total = game.n_defender_strategies
+    resolver = CombinationGenerator(game.defender_strategies)
+    single_ranks = range(0, total, max(1, total // SINGLE_UNRANKS))
+    yield "unrank", len(single_ranks), lambda: [resolver.unrankVaryingLengthCombination(r) for r in single_ranks]
+    yield "unrank-batch", total, lambda: resolver.unrankVaryingLengthBatch(np.arange(total))
+
+    relationships = sum(1 for o in objects if o["type"] == "relationship")
+    memory_store = IndexedStore(MemoryStore(stix_data=objects))
+    yield "get-related[graph]", relationships, lambda: sx.get_related(
+        thesrc, "course-of-action", "mitigates", "attack-pattern")
+    yield "get-related[memory]", relationships, lambda: sx.get_related(
+        memory_store, "course-of-action", "mitigates", "attack-pattern")
+    strategies = len(game.attacker_strategies) + len(game.defender_strategies)
+    yield "build-game", strategies, lambda: build_game(thesrc, settings)
+
+    items = {
+        GameAlgorithm.MonteCarlo: n_simulations * total,
+        GameAlgorithm.UpperConfidenceBound: total + n_simulations - 1,
+        GameAlgorithm.Analytic: total,
+        GameAlgorithm.Optimization: total,
+    }
+    for algorithm, count in items.items():
+        for criteria in DefenderCriteria:
+            yield f"{algorithm.name}[{criteria.name}]", count, lambda a=algorithm, c=criteria: solve_game(
+                game, c, a, n_simulations=n_simulations, b=b, seed=seed, keep_values=False)
+    yield GameAlgorithm.DoubleOracle.name, total, lambda: solve_game(
+        game, DefenderCriteria.LAPLACE_REASON, GameAlgorithm.DoubleOracle)
+    for sampling in (SamplingMode.Common, SamplingMode.Sobol):
+        for criteria in DefenderCriteria:
+            yield f"{GameAlgorithm.MonteCarlo.name}-{sampling.name}[{criteria.name}]", n_simulations * total, \
+                lambda s=sampling, c=criteria: solve_game(game, c, GameAlgorithm.MonteCarlo,
+                                                          n_simulations=n_simulations, seed=seed, keep_values=False,
+                                                          sampling=s)
+    # Items are the samples plain Monte Carlo would need, throughput compares the two directly
+    yield f"{GameAlgorithm.Racing.name}[{DefenderCriteria.LAPLACE_REASON.name}]", n_simulations * total, \
+        lambda: solve_game(game, DefenderCriteria.LAPLACE_REASON, GameAlgorithm.Racing, n_simulations=n_simulations,
+                           seed=seed, keep_values=False)
+
+
+def run(sizes, n_techniques, n_tactics, density, n_simulations, b, repeat, seed, only=None, report=print):
+    """Run every benchmark for every size, returns the results as dicts."""
+    import stixcache
+
+    results = []
+    report(f"{'benchmark':<36}{'S':>4}{'seconds':>12}{'items':>14}{'items/s':>14}{'peak MiB':>11}")
+    with tempfile.TemporaryDirectory(prefix="gtsec-bench-") as cache_dir:
+        for n_mitigations in sizes:
+            version = f"synthetic-{n_mitigations}"
+            objects = synthetic.generate_bundle(n_techniques, n_mitigations, n_tactics, density, seed)
+            synthetic.cache_bundle(objects, version, cache_dir)
+            thesrc = stixcache.get_source(synthetic.DOMAIN, version, cache_dir=cache_dir, offline=True)
+            settings = synthetic.project_settings(objects, version, seed=seed)
+            for name, items, fn in cases(thesrc, objects, settings, n_simulations, b, seed):
+                if only and not any(pattern in name for pattern in only):
+                    continue
+                seconds, peak = measure(fn, repeat)
+                result = {"benchmark": name, "mitigations": n_mitigations, "techniques": n_techniques,
+                          "tactics": n_tactics, "density": density, "simulations": n_simulations,
+                          "seconds": seconds, "items": items, "throughput": items / seconds if seconds else None,
+                          "peak_bytes": peak}
+                results.append(result)
+                report(f"{name:<36}{n_mitigations:>4}{seconds:>12.6f}{items:>14,}"
+                       f"{result['throughput'] or 0:>14,.0f}{peak / 2 ** 20:>11.2f}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the engines on synthetic ATT&CK bundles, offline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 12, 16], help="numbers of mitigations")
+    parser.add_argument("--techniques", type=int, default=100)
+    parser.add_argument("--tactics", type=int, default=10)
+    parser.add_argument("--density", type=float, default=0.05, help="probability of every mitigates relationship")
+    parser.add_argument("--simulations", type=int, default=20, help="Monte Carlo simulations / UCB steps")
+    parser.add_argument("--b", type=float, default=1000, help="UCB exploration parameter")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark, the best one is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", help="run benchmarks whose names contain any of these")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.techniques, args.tactics, args.density, args.simulations, args.b, args.repeat,
+                  args.seed, args.only)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import numpy as np
+
+from maths import pack_bits, popcount
+
+
+class CoverageIndex:
+    """Dense mitigation x technique coverage built once from `stixlib.mitigation_mitigates_technique_ids`.
+
+    Mitigations and techniques get integer ids equal to their position in the strategy lists, so
+    combinations produced by `CombinationGenerator` over those lists map onto rows and columns
+    directly. Coverage is kept both as a boolean matrix and as uint64 bitsets per mitigation.
+    """
+
+    def __init__(self, mitigation_ids, technique_ids, relations):
+        """relations maps a mitigation id to the techniques it mitigates, either as get_related entries
+        ({"object": ..., "relationship": ...}) or as plain technique ids (stixlib.get_related_ids)."""
+        self.mitigation_ids = list(mitigation_ids)
+        self.technique_ids = list(technique_ids)
+        # Strategy lists may hold one object several times (e.g. two apps with the same mitigation),
+        # every copy gets its own position but the same coverage
+        self.mitigation_index = {}
+        for i, m_id in enumerate(self.mitigation_ids):
+            self.mitigation_index.setdefault(m_id, i)
+        self.technique_index = {}
+        for i, t_id in enumerate(self.technique_ids):
+            self.technique_index.setdefault(t_id, i)
+
+        technique_positions = {}
+        for i, t_id in enumerate(self.technique_ids):
+            technique_positions.setdefault(t_id, []).append(i)
+
+        self.matrix = np.zeros((len(self.mitigation_ids), len(self.technique_ids)), dtype=bool)
+        for i, m_id in enumerate(self.mitigation_ids):
+            for relation in relations.get(m_id, []):
+                t_id = relation if isinstance(relation, str) else relation.get("object").get("id")
+                self.matrix[i, technique_positions.get(t_id, [])] = True
+        self.bits = pack_bits(self.matrix)
+
+    @classmethod
+    def from_strategies(cls, defender_strategies, attacker_strategies, relations):
+        """Index for strategy lists of stixlib.StixRecord."""
+        return cls([m.stix_id for m in defender_strategies], [t.stix_id for t in attacker_strategies], relations)
+
+    @property
+    def n_mitigations(self):
+        return self.matrix.shape[0]
+
+    @property
+    def n_techniques(self):
+        return self.matrix.shape[1]
+
+    def covers(self, mitigation_id, technique_id):
+        """Single pair lookup, the O(1) replacement of stixlib.does_mitigation_mitigates_technique."""
+        m = self.mitigation_index.get(mitigation_id)
+        t = self.technique_index.get(technique_id)
+        return m is not None and t is not None and bool(self.matrix[m, t])
+
+    def mitigation_mask(self, positions):
+        mask = np.zeros(self.n_mitigations, dtype=bool)
+        mask[list(positions)] = True
+        return mask
+
+    def technique_mask(self, positions):
+        mask = np.zeros(self.n_techniques, dtype=bool)
+        mask[list(positions)] = True
+        return mask
+
+    def pair_counts(self, attacks):
+        """Number of techniques of each attack set covered by each mitigation.
+
+        attacks is a boolean array (..., techniques) or its packed bitsets (..., words);
+        returns int64 array (..., mitigations).
+        """
+        attacks = np.asarray(attacks)
+        if attacks.dtype == bool:
+            return attacks.astype(np.int64) @ self.matrix.T.astype(np.int64)
+        return popcount(attacks[..., np.newaxis, :] & self.bits)
+
+    def covered_pairs(self, defenders, attacks):
+        """Number of covered (mitigation, technique) pairs for every defender set against every attack set.
+
+        defenders is a boolean array (D, mitigations), attacks (A, techniques) or bitsets (A, words);
+        returns int64 matrix (D, A).
+        """
+        return np.asarray(defenders, dtype=np.int64) @ self.pair_counts(attacks).T
+
+    def is_mitigated(self, defenders, attacks):
+        """Whether any mitigation of the defender set covers any technique of the attack set, matrix (D, A)."""
+        return self.covered_pairs(defenders, attacks) > 0
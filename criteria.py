@@ -0,0 +1,122 @@
+import heapq
+
+import numpy as np
+from scipy import sparse
+
+import profiling
+from projectsharablestate import DefenderCriteria
+
+
+def _column_reduce(block, name):
+    # Sparse reductions count implicit zeros too, so both storages give the same values
+    values = getattr(block, name)(axis=0)
+    return values.toarray().ravel() if sparse.issparse(values) else np.asarray(values).ravel()
+
+
+def laplace_columns(block, n_simulations):
+    # Математическое ожидание по столбцу, нулевые суммы маскируются
+    return np.ma.masked_equal(_column_reduce(block, "sum"), 0) * (1 / n_simulations)
+
+
+def wald_columns(block):
+    # Максимум по столбцу, нулевые значения маскируются
+    return np.ma.masked_equal(_column_reduce(block, "max"), 0)
+
+
+def savage_columns(block):
+    # Наибольший риск столбца относительно его минимума
+    return np.ma.masked_invalid(_column_reduce(block, "max") - _column_reduce(block, "min"))
+
+
+def column_criteria(criteria, block, n_simulations):
+    """Criteria value of every column of a payoff block (simulations, columns), masked where undefined.
+
+    block is a dense array or a scipy sparse matrix (CSC is the fast layout for it).
+    """
+    if criteria == DefenderCriteria.LAPLACE_REASON:
+        return laplace_columns(block, n_simulations)
+    if criteria == DefenderCriteria.WALD_MAXIMIN:
+        return wald_columns(block)
+    if criteria == DefenderCriteria.SAVAGE_MINIMAX:
+        return savage_columns(block)
+    raise RuntimeError("Unknown criteria %s!" % criteria)
+
+
+class TopK:
+    """k smallest (value, column) pairs seen so far, O(k) memory."""
+
+    def __init__(self, k):
+        self.k = k
+        # max-heap on value through negation, ties keep the lower column
+        self._heap = []
+
+    def update(self, start, values):
+        values = np.ma.asarray(values)
+        candidates = np.flatnonzero(~np.ma.getmaskarray(values))
+        if len(candidates) > self.k:
+            data = values.data[candidates]
+            kth = np.partition(data, self.k - 1)[self.k - 1]
+            # Ties with the k-th value keep the lowest columns, like argmin does
+            below = candidates[data < kth]
+            candidates = np.concatenate([below, candidates[data == kth][:self.k - len(below)]])
+        for column in candidates:
+            self.push(start + int(column), float(values.data[column]))
+
+    def push(self, column, value):
+        item = (-value, -column)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+
+    def items(self):
+        """[(column, value)] sorted by value."""
+        return [(-column, -value) for value, column in sorted(self._heap, reverse=True)]
+
+
+class CriteriaReducer:
+    """Online criteria over a payoff matrix consumed column block by column block.
+
+    Every block has all simulations of its columns, so each column value is final after its block.
+    Keeps the per-column values (O(columns), needed for the charts) unless keep_values is off, the
+    top k columns, and the simulations of the current best column.
+    """
+
+    def __init__(self, criteria, n_simulations, n_columns, k=3, keep_values=True):
+        self.criteria = criteria
+        self.n_simulations = n_simulations
+        self.n_columns = n_columns
+        self.top = TopK(k)
+        self.values = np.ma.masked_all(n_columns) if keep_values else None
+        self.best_column = None
+
+    def update(self, start, block):
+        if not sparse.issparse(block):
+            block = np.asarray(block)
+        with profiling.phase("criteria"):
+            best = self.best()
+            self.update_values(start, column_criteria(self.criteria, block, self.n_simulations))
+            if self.best() != best:
+                column = block[:, [self.best()[0] - start]]
+                self.best_column = (column.toarray() if sparse.issparse(column) else column).ravel()
+
+    def update_values(self, start, values):
+        """Take already computed criteria values of columns [start, start + len(values))."""
+        if self.values is not None:
+            self.values[start:start + len(values)] = values
+        self.top.update(start, values)
+
+    def best(self):
+        """(column, value) with the lowest criteria value, None if every column is masked."""
+        items = self.top.items()
+        return items[0] if items else None
+
+    def merge(self, other, offset):
+        """Add results of a reducer that covered columns [offset, offset + other.n_columns)."""
+        best = self.best()
+        if self.values is not None:
+            self.values[offset:offset + other.n_columns] = other.values
+        for column, value in other.top.items():
+            self.top.push(offset + column, value)
+        if self.best() != best:
+            self.best_column = other.best_column
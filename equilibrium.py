@@ -0,0 +1,107 @@
+"""Mixed-strategy equilibrium of the defender/attacker game by double oracle.
+
+The game is zero-sum on the defender payoff a(D, A) = sum over m in D, t in A of cost_m * [m covers t],
+the defender minimises it and the attacker maximises it. Both players pick non-empty subsets, so
+the full matrix is (2^S - 1) x (2^T - 1). Double oracle solves the matrix game restricted to a few
+strategies with an LP, adds both players' best responses to the restricted mixed strategies and
+repeats until the best responses cannot improve on the restricted game value.
+
+Payoffs are linear in the chosen subsets, so a best response is a linear optimisation over
+non-empty subsets: take every element with an improving weight, or the single best one.
+Mitigations covering none of the attacker's techniques always pay 0 and are left out of defender
+strategies, as zero columns are masked by the criteria.
+"""
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import numpy as np
+from scipy.optimize import linprog
+
+
+@dataclass
+class Equilibrium:
+    value: float
+    # (probability, positions) of every strategy in the support
+    defender: List[Tuple[float, np.ndarray]] = field(default_factory=list)
+    attacker: List[Tuple[float, np.ndarray]] = field(default_factory=list)
+    iterations: int = 0
+    gap: float = 0.0
+
+
+def solve_matrix_game(payoff):
+    """Minimiser's and maximiser's mixed strategies and value of a zero-sum matrix game (rows minimise)."""
+    rows, cols = payoff.shape
+    # Row player: min v s.t. payoff^T x <= v, sum x = 1; variables [x, v]
+    result = linprog(np.append(np.zeros(rows), 1.0),
+                     A_ub=np.hstack([payoff.T, -np.ones((cols, 1))]), b_ub=np.zeros(cols),
+                     A_eq=np.append(np.ones(rows), 0.0)[np.newaxis, :], b_eq=[1.0],
+                     bounds=[(0, None)] * rows + [(None, None)], method="highs")
+    if result.status != 0:
+        raise RuntimeError(f"Restricted game LP failed: {result.message}")
+    row_strategy = result.x[:rows]
+    # Column strategy are the duals of the payoff constraints
+    col_strategy = -result.ineqlin.marginals
+    col_strategy = np.clip(col_strategy, 0, None)
+    col_strategy /= col_strategy.sum()
+    return row_strategy, col_strategy, result.x[rows]
+
+
+def _best_subset(weights, allowed, maximise):
+    """Non-empty subset of allowed positions optimising the sum of weights."""
+    signed = weights if maximise else -weights
+    chosen = allowed & (signed > 0)
+    if not chosen.any():
+        candidates = np.flatnonzero(allowed)
+        chosen = np.zeros(len(weights), dtype=bool)
+        chosen[candidates[np.argmax(signed[candidates])]] = True
+    return chosen
+
+
+def double_oracle(coverage, costs, tolerance=1e-9, max_iterations=1000, progress=None):
+    """Equilibrium of the full defender/attacker game, see the module docstring.
+
+    progress(iteration / max_iterations) is called before every oracle iteration, so a raising
+    callback stops the search.
+    """
+    # K[m, t] - payoff of mitigation m against technique t
+    kernel = np.asarray(costs, dtype=float)[:, np.newaxis] * coverage.matrix
+    useful = coverage.matrix.any(axis=1)
+    if not useful.any():
+        return Equilibrium(value=0.0)
+    all_techniques = np.ones(coverage.n_techniques, dtype=bool)
+
+    # Start from the full attack and the defender's best answer to it
+    attacks = [all_techniques]
+    defenders = [_best_subset(kernel @ all_techniques, useful, maximise=False)]
+
+    gap = np.inf
+    for iteration in range(1, max_iterations + 1):
+        if progress is not None:
+            progress((iteration - 1) / max_iterations)
+        payoff = np.array(defenders, dtype=float) @ kernel @ np.array(attacks, dtype=float).T
+        defender_mix, attacker_mix, value = solve_matrix_game(payoff)
+
+        # Attacker best response bounds the value from above, defender's from below
+        technique_weights = (defender_mix @ np.array(defenders, dtype=float)) @ kernel
+        attack = _best_subset(technique_weights, all_techniques, maximise=True)
+        mitigation_weights = kernel @ (attacker_mix @ np.array(attacks, dtype=float))
+        defence = _best_subset(mitigation_weights, useful, maximise=False)
+        gap = technique_weights @ attack - mitigation_weights @ defence
+
+        added = False
+        if not any((attack == a).all() for a in attacks):
+            attacks.append(attack)
+            added = True
+        if not any((defence == d).all() for d in defenders):
+            defenders.append(defence)
+            added = True
+        if gap <= tolerance or not added:
+            break
+
+    return Equilibrium(
+        value=float(value),
+        defender=[(float(p), np.flatnonzero(d)) for p, d in zip(defender_mix, defenders) if p > tolerance],
+        attacker=[(float(p), np.flatnonzero(a)) for p, a in zip(attacker_mix, attacks) if p > tolerance],
+        iterations=iteration,
+        gap=float(max(gap, 0.0)),
+    )
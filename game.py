@@ -0,0 +1,175 @@
+"""The game of a project outside the UI: strategy lists, coverage and costs, solved by any GameAlgorithm."""
+import operator
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import profiling
+import stixlib as sx
+from coverage import CoverageIndex
+from projectsharablestate import DefenderCriteria, GameAlgorithm, ProjectSettings, SamplingMode
+
+
+@dataclass
+class Game:
+    attacker_strategies: List[sx.StixRecord]
+    defender_strategies: List[sx.StixRecord]
+    coverage: CoverageIndex
+    costs: np.ndarray
+
+    @property
+    def n_defender_strategies(self) -> int:
+        return 2 ** len(self.defender_strategies) - 1
+
+    @property
+    def n_attacker_strategies(self) -> int:
+        return 2 ** len(self.attacker_strategies) - 1
+
+
+@dataclass
+class GameResult:
+    algorithm: GameAlgorithm
+    criteria: DefenderCriteria
+    seconds: float
+    # (rank, criteria value) of the best strategy and of the top ones
+    best: Optional[Tuple[int, float]] = None
+    top: List[Tuple[int, float]] = field(default_factory=list)
+    # Criteria value of every strategy, when it was kept
+    values: Optional[np.ndarray] = None
+    # Only for GameAlgorithm.DoubleOracle
+    equilibrium: Optional[object] = None
+    # Only for GameAlgorithm.Racing, racing.RacingStats
+    racing: Optional[object] = None
+    reducer: Optional[object] = None
+    # Sparse payoff matrix and Monte Carlo samples, with keep_matrix
+    matrix: Optional[object] = None
+    samples: Optional[object] = None
+    # Strategy counts of an incremental update, see incremental.SampleStore.update
+    counts: Optional[dict] = None
+
+
+def build_game(thesrc, settings: ProjectSettings) -> Game:
+    """Strategy lists of the project, in the same order as the app builds them."""
+    with profiling.phase("strategy_lists"):
+        tactics = sx.get_tactics_by_ids(thesrc, tactics_ids=settings.attacker_tactics)
+
+        attacker_strategies = []
+        for tactic in tactics:
+            attacker_strategies += sx.get_techniques_by_tactics(thesrc, tactics=[tactic.get("x_mitre_shortname")])
+        attacker_strategies.sort(key=operator.attrgetter("id"), reverse=True)
+
+        defender_strategies = []
+        for app in settings.defender_apps:
+            defender_strategies += sx.get_mitigations_by_ids(thesrc, migitation_ids=app.app_mitigations)
+        defender_strategies.sort(key=operator.attrgetter("id"), reverse=True)
+
+        attacker_strategies = sx.to_records(attacker_strategies)
+        defender_strategies = sx.to_records(defender_strategies)
+    with profiling.phase("relation_build"):
+        coverage = CoverageIndex.from_strategies(defender_strategies, attacker_strategies,
+                                                 sx.mitigation_mitigates_technique_ids(thesrc))
+    costs = settings.cost_table().cost_vector(coverage.mitigation_ids)
+    return Game(attacker_strategies, defender_strategies, coverage, costs)
+
+
+def solve_game(game: Game, criteria: DefenderCriteria, algorithm: GameAlgorithm, n_simulations=10, b=1000,
+               seed=None, workers=1, keep_values=False, keep_matrix=False, keep_samples=False, samples=None,
+               progress=None, partial=None, confidence=0.95, certified_top=1, sampling=SamplingMode.Independent) -> GameResult:
+    """Run algorithm on the game and reduce it by criteria.
+
+    The payoff matrix is built only with keep_matrix (serial Monte Carlo and UCB), as a sparse matrix.
+    Serial Monte Carlo updates samples (incremental.SampleStore of an earlier run) when they fit the
+    game, and keeps dense attack samples for later updates only with keep_samples. progress(done fraction) is called by the engines, partial(reducer)
+    after it while the criteria are being reduced. Racing uses n_simulations as the limit per
+    strategy and certifies the best certified_top strategies at confidence. Monte Carlo with
+    common sampling runs the same attacks against every strategy, serially and without samples
+    for incremental updates.
+    """
+    import analytic
+    import parallel
+    import simulation
+    from criteria import CriteriaReducer
+
+    started = time.perf_counter()
+    n_columns = game.n_defender_strategies
+    result = GameResult(algorithm=algorithm, criteria=criteria, seconds=0.0)
+    reducer = None
+
+    def report(done):
+        if progress is not None:
+            progress(done)
+        if partial is not None and reducer is not None:
+            partial(reducer)
+
+    if algorithm == GameAlgorithm.MonteCarlo:
+        if sampling != SamplingMode.Independent:
+            reducer = CriteriaReducer(criteria, n_simulations, n_columns, keep_values=keep_values)
+            result.matrix = simulation.common_monte_carlo(game.coverage, game.costs, n_simulations, seed=seed,
+                                                          sobol=sampling == SamplingMode.Sobol, progress=report,
+                                                          reducer=reducer, keep_matrix=keep_matrix,
+                                                          sparse_output=True)
+        elif workers > 1:
+            reducer = parallel.parallel_monte_carlo(game.coverage, game.costs, n_simulations, criteria, seed=seed,
+                                                    workers=workers, keep_values=keep_values, progress=report)
+        elif keep_samples or (samples is not None and samples.can_update(game.coverage, n_simulations, seed)):
+            from scipy import sparse
+
+            from incremental import SampleStore
+
+            reducer = CriteriaReducer(criteria, n_simulations, n_columns, keep_values=keep_values)
+            if samples is not None and samples.can_update(game.coverage, n_simulations, seed):
+                result.samples, result.counts = samples.update(game.coverage, game.costs, progress=report)
+            else:
+                result.samples = SampleStore.simulate(game.coverage, game.costs, n_simulations, seed=seed,
+                                                      progress=report)
+            reducer.update(0, result.samples.payoffs)
+            if keep_matrix:
+                result.matrix = sparse.csc_matrix(result.samples.payoffs)
+            profiling.peak("payoff_matrix_bytes", result.samples.payoffs.nbytes + result.samples.attacks.nbytes)
+            if not keep_samples:
+                result.samples = None
+        else:
+            reducer = CriteriaReducer(criteria, n_simulations, n_columns, keep_values=keep_values)
+            result.matrix = simulation.monte_carlo(game.coverage, game.costs, n_simulations, seed=seed,
+                                                   progress=report, reducer=reducer, keep_matrix=keep_matrix,
+                                                   sparse_output=True)
+    elif algorithm == GameAlgorithm.UpperConfidenceBound:
+        reducer = CriteriaReducer(criteria, n_simulations, n_columns, keep_values=keep_values)
+        matrix = simulation.ucb(game.coverage, game.costs, n_simulations, b, seed=seed, progress=report).tocsc()
+        reducer.update(0, matrix)
+        if keep_matrix:
+            result.matrix = matrix
+    elif algorithm == GameAlgorithm.Analytic:
+        reducer = analytic.analytic_criteria(game.coverage, game.costs, criteria, keep_values=keep_values,
+                                             progress=report)
+    elif algorithm == GameAlgorithm.Optimization:
+        import solver
+
+        reducer = CriteriaReducer(criteria, n_simulations, n_columns, keep_values=False)
+        for rank, value, _ in solver.best_strategies(game.coverage, game.costs, criteria, progress=report):
+            reducer.top.push(rank, value)
+    elif algorithm == GameAlgorithm.Racing:
+        import racing
+
+        reducer = CriteriaReducer(criteria, n_simulations, n_columns, k=max(3, certified_top), keep_values=keep_values)
+        result.racing = racing.racing(game.coverage, game.costs, criteria, reducer, n_simulations,
+                                      confidence=confidence, k=certified_top, seed=seed, progress=report)
+    elif algorithm == GameAlgorithm.DoubleOracle:
+        import equilibrium
+
+        result.equilibrium = equilibrium.double_oracle(game.coverage, game.costs, progress=report)
+    else:
+        raise RuntimeError("Unknown algorithm %s!" % algorithm)
+
+    if reducer is not None:
+        result.reducer = reducer
+        result.best = reducer.best()
+        result.top = reducer.top.items()
+        result.values = reducer.values
+    result.seconds = time.perf_counter() - started
+    profile = profiling.current()
+    if profile is not None:
+        profile.add_phase("solve", result.seconds)
+    return result
@@ -0,0 +1,157 @@
+"""Incremental Monte Carlo: keep the attack samples of a run and recompute only what a change touches.
+
+A strategy's payoff against an attack only depends on its own mitigations (see simulation):
+
+    a(j, A) = sum over m in j of cost_m * |coverage_m & A|
+
+so after the apps of a project change:
+  - strategies made of mitigations that were there before keep their attack samples (their rank
+    moves, ranks are remapped through the membership masks) and are only corrected by the terms
+    of mitigations whose price or coverage changed;
+  - strategies including a new mitigation get fresh samples;
+  - strategies including a removed mitigation are gone.
+
+Samples of every strategy are kept, so this is meant for runs whose payoff matrix is kept anyway.
+Fresh samples come from streams keyed by (seed, block, generation), an updated run is statistically
+equivalent to a full one but not identical to a full run with the same seed.
+"""
+import numpy as np
+
+import profiling
+from maths import CombinationGenerator, popcount
+from simulation import (COLUMN_CHUNK, chunk_attacks, new_seed, payoff, sample_attacks, strategies_count,
+                        strategy_masks)
+
+# Columns processed at once when remapping
+BLOCK = 16 * COLUMN_CHUNK
+
+
+def fresh_rng(seed, block, generation):
+    # Three-element spawn key never collides with the streams of simulation
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(block, generation, 0)))
+
+
+def _match_positions(old_ids, new_ids):
+    """New position of every old position (-1 if removed); repeated ids are matched in order."""
+    free = {}
+    for position, stix_id in enumerate(new_ids):
+        free.setdefault(stix_id, []).append(position)
+    matched = np.full(len(old_ids), -1, dtype=np.int64)
+    for position, stix_id in enumerate(old_ids):
+        positions = free.get(stix_id)
+        if positions:
+            matched[position] = positions.pop(0)
+    return matched
+
+
+class SampleStore:
+    """Attack samples (simulations, strategies, words) and payoffs (simulations, strategies) of a run."""
+
+    def __init__(self, mitigation_ids, technique_ids, bits, costs, attacks, payoffs, seed, generation=0):
+        self.mitigation_ids = list(mitigation_ids)
+        self.technique_ids = list(technique_ids)
+        self.bits = bits
+        self.costs = np.asarray(costs, dtype=float)
+        self.attacks = attacks
+        self.payoffs = payoffs
+        self.seed = seed
+        self.generation = generation
+
+    @property
+    def n_simulations(self):
+        return self.payoffs.shape[0]
+
+    @classmethod
+    def simulate(cls, coverage, costs, n_simulations, seed=None, progress=None):
+        """Full run, same samples and payoffs as simulation.monte_carlo with the same seed."""
+        if seed is None:
+            seed = new_seed()
+        total = strategies_count(coverage.n_mitigations)
+        words = coverage.bits.shape[1]
+        attacks = np.zeros((n_simulations, total, words), dtype=np.uint64)
+        payoffs = np.zeros((n_simulations, total))
+        for chunk in range(-(-total // COLUMN_CHUNK)):
+            lo = chunk * COLUMN_CHUNK
+            block = chunk_attacks(coverage.n_techniques, n_simulations, seed, chunk, total)
+            hi = lo + block.shape[1]
+            attacks[:, lo:hi] = block
+            payoffs[:, lo:hi] = payoff(coverage, costs, strategy_masks(coverage.n_mitigations, lo, hi), block)
+            if progress is not None:
+                progress(hi / total)
+        return cls(coverage.mitigation_ids, coverage.technique_ids, coverage.bits.copy(), costs, attacks, payoffs,
+                   seed)
+
+    def can_update(self, coverage, n_simulations, seed):
+        """Whether update() applies: same attacker techniques, simulations and seed.
+
+        A run with a random seed (None) takes the seed of the store, its samples are random already.
+        """
+        return (self.technique_ids == coverage.technique_ids and self.n_simulations == n_simulations
+                and (seed is None or self.seed == seed))
+
+    def update(self, coverage, costs, progress=None):
+        """Store for the changed mitigations and costs and counts of (reused, corrected, sampled) strategies."""
+        if self.technique_ids != coverage.technique_ids:
+            raise ValueError("Attacker techniques changed, samples cannot be reused")
+        costs = np.asarray(costs, dtype=float)
+        n_old, n_new = len(self.mitigation_ids), coverage.n_mitigations
+        matched = _match_positions(self.mitigation_ids, coverage.mitigation_ids)
+        kept = np.flatnonzero(matched >= 0)
+        is_new = np.ones(n_new, dtype=bool)
+        is_new[matched[kept]] = False
+
+        # Kept mitigations whose terms differ, as (new position, old position)
+        dirty = [(int(matched[o]), int(o)) for o in kept
+                 if costs[matched[o]] != self.costs[o] or (coverage.bits[matched[o]] != self.bits[o]).any()]
+
+        total = strategies_count(n_new)
+        attacks = np.zeros((self.n_simulations, total, self.attacks.shape[2]), dtype=np.uint64)
+        payoffs = np.zeros((self.n_simulations, total))
+        old_resolver = CombinationGenerator(range(n_old))
+        generation = self.generation + 1
+        counts = {"reused": 0, "corrected": 0, "sampled": 0}
+
+        for block, lo in enumerate(range(0, total, BLOCK)):
+            hi = min(lo + BLOCK, total)
+            masks = strategy_masks(n_new, lo, hi)
+            fresh = masks[:, is_new].any(axis=1)
+
+            reused = np.flatnonzero(~fresh)
+            if len(reused):
+                with profiling.phase("sample_reuse"):
+                    old_masks = np.zeros((len(reused), n_old), dtype=bool)
+                    old_masks[:, kept] = masks[reused][:, matched[kept]]
+                    old_ranks = old_resolver.rankVaryingLengthBatch(old_masks)
+                    block_attacks = self.attacks[:, old_ranks]
+                    block_payoffs = self.payoffs[:, old_ranks]
+                    corrected = np.zeros(len(reused), dtype=bool)
+                    for new_position, old_position in dirty:
+                        columns = masks[reused, new_position]
+                        if not columns.any():
+                            continue
+                        corrected |= columns
+                        selected = block_attacks[:, columns]
+                        block_payoffs[:, columns] += (
+                            costs[new_position] * popcount(selected & coverage.bits[new_position])
+                            - self.costs[old_position] * popcount(selected & self.bits[old_position]))
+                    attacks[:, lo + reused] = block_attacks
+                    payoffs[:, lo + reused] = block_payoffs
+                    counts["corrected"] += int(corrected.sum())
+                    counts["reused"] += int((~corrected).sum())
+
+            sampled = np.flatnonzero(fresh)
+            if len(sampled):
+                profiling.count("samples", self.n_simulations * len(sampled))
+                with profiling.phase("sampling"):
+                    block_attacks = sample_attacks(fresh_rng(self.seed, block, generation), coverage.n_techniques,
+                                                   (self.n_simulations, len(sampled)))
+                attacks[:, lo + sampled] = block_attacks
+                payoffs[:, lo + sampled] = payoff(coverage, costs, masks[sampled], block_attacks)
+                counts["sampled"] += len(sampled)
+
+            if progress is not None:
+                progress(hi / total)
+
+        store = SampleStore(coverage.mitigation_ids, coverage.technique_ids, coverage.bits.copy(), costs, attacks,
+                            payoffs, self.seed, generation)
+        return store, counts
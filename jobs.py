@@ -0,0 +1,156 @@
+"""Background jobs: long runs outside the Streamlit script run.
+
+A job runs a function in a worker thread of a JobRunner shared by the server process, so it
+survives reruns of the script; the UI keeps the job id and polls its status, progress and partial
+result. The function receives its Job first and reports through it:
+
+    def run(job, ...):
+        for done in ...:
+            job.report(done)                  # raises JobCancelled once cancel() was called
+            job.publish(lambda: snapshot())   # computed at most every PUBLISH_INTERVAL seconds
+        return result
+
+Reporting only stores numbers, so engines may report as often as they like; rendering happens when
+the UI polls. Results can be large, the UI takes them over with take_result() once and discards
+jobs it no longer follows, so the runner keeps only small finished jobs around.
+"""
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+# Seconds between two partial results of a job
+PUBLISH_INTERVAL = 0.25
+
+
+class JobCancelled(Exception):
+    """Raised inside a job by report() after the job was cancelled."""
+
+
+class Job:
+    def __init__(self, key=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = PENDING
+        self.progress = 0.0
+        self.partial = None
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._published = 0.0
+
+    @property
+    def finished(self):
+        return self.status in (DONE, CANCELLED, FAILED)
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def seconds(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished_at or time.perf_counter()) - self.started
+
+    def cancel(self):
+        self._cancel.set()
+
+    def report(self, done):
+        """Store the done fraction, stop the job here if it was cancelled."""
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+        self.progress = min(max(float(done), 0.0), 1.0)
+
+    def take_result(self):
+        """Hand the result over to the caller, the job keeps no reference to it."""
+        result, self.result, self.partial = self.result, None, None
+        return result
+
+    def publish(self, snapshot):
+        """Store snapshot() as the partial result, skipped when the last one is too recent."""
+        now = time.perf_counter()
+        if now - self._published < PUBLISH_INTERVAL:
+            return
+        self._published = now
+        self.partial = snapshot()
+
+
+class JobRunner:
+    """Thread pool running jobs; finished jobs are forgotten oldest first beyond keep."""
+
+    def __init__(self, max_workers=2, keep=64):
+        self.keep = keep
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, key=None, **kwargs):
+        """Start fn(job, *args, **kwargs) in the background, returns the Job."""
+        job = Job(key)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.started = time.perf_counter()
+        job.status = RUNNING
+        try:
+            if job.cancelled:
+                raise JobCancelled(job.id)
+            job.result = fn(job, *args, **kwargs)
+            job.progress = 1.0
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+            job.status = FAILED
+        finally:
+            job.finished_at = time.perf_counter()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.keep, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def discard(self, job_id):
+        """Cancel the job and forget it with its result, a running one finishes unreferenced."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job.cancel()
+            job.take_result()
+        return job
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for job in self.jobs():
+                job.cancel()
+        self._executor.shutdown(wait=True)
@@ -1,46 +1,180 @@
 from math import comb
+import numpy as np
 
 
 class CombinationGenerator:
+    # Batch methods work on int64 ranks, 2^62 - 1 combinations at most
+    MAX_BATCH_N = 62
+
     def __init__(self, n_set):
         self.n_set = n_set
+        self._pascal = None
+        self._pascal_array = None
+
+    def pascal(self):
+        """Pascal triangle as python ints, pascal[a][b] = C(a, b), built on first use."""
+        if self._pascal is None:
+            n = len(self.n_set)
+            table = [[1] + [0] * n]
+            for a in range(1, n + 1):
+                prev = table[-1]
+                table.append([1] + [prev[b - 1] + prev[b] for b in range(1, n + 1)])
+            self._pascal = table
+        return self._pascal
+
+    def _batch_tables(self):
+        n = len(self.n_set)
+        if n > self.MAX_BATCH_N:
+            raise ValueError(f"Batch ranking supports at most {self.MAX_BATCH_N} elements, got {n}")
+        if self._pascal_array is None:
+            # Extra zero column lets lookups with b = -1 (nothing left to choose) return 0
+            pascal = np.zeros((n + 1, n + 2), dtype=np.int64)
+            pascal[:, :n + 1] = np.array(self.pascal(), dtype=np.int64)
+            # offsets[k] - number of combinations shorter than k
+            offsets = np.zeros(n + 2, dtype=np.int64)
+            offsets[2:] = np.cumsum(pascal[n, 1:n + 1])
+            self._pascal_array = pascal, offsets
+        return self._pascal_array
 
     # rank - index (mth combination)
     # n - set of n
     # k - chosen k at a time
     # https://gist.github.com/jonesinator/eed9614d2599921d5a4caffd7f2055bb
     def unrankFixedLengthCombination(self, n, k, rank):
+        pascal = self.pascal() if n == len(self.n_set) else None
+        binom = (lambda a, b: pascal[a][b] if b <= a else 0) if pascal else comb
         result = []
         a = n
         b = k
-        x = (comb(n, k) - 1) - rank
+        x = (binom(n, k) - 1) - rank
         for i in range(0, k):
             a = a - 1
-            while comb(a, b) > x:
+            while binom(a, b) > x:
                 a = a - 1
             result.append(n - 1 - a)
-            x = x - comb(a, b)
+            x = x - binom(a, b)
             b = b - 1
         return [self.n_set[i] for i in result]
 
     def unrankVaryingLengthCombination(self, rank):
         # Find length of k such that the rank is within the space of k-combination
         n = len(self.n_set)
+        pascal = self.pascal()
         cumulative = 0
         found_k = 0
         for k in range(1, n + 1):
-            cumulative += comb(n, k)
+            cumulative += pascal[n][k]
             found_k = k
             if rank < cumulative:
                 break
         # Adjust rank to find position within k-combinations
-        rank = (rank - cumulative) + comb(n, found_k)
+        rank = (rank - cumulative) + pascal[n][found_k]
 
         # Just a debug check to make sure algorithm will not fail, should never be called
-        if rank >= comb(n, found_k):
+        if rank >= pascal[n][found_k]:
             raise ValueError(
                 f"New Rank {rank} is greater than or equal to the maximum rank for C({n},{found_k})")
 
         combination = self.unrankFixedLengthCombination(n, found_k, rank)
 
         return combination
+
+    def rankVaryingLengthCombination(self, indices):
+        """Inverse of unrankVaryingLengthCombination for a combination given by element indices."""
+        n = len(self.n_set)
+        pascal = self.pascal()
+        chosen = set(indices)
+        k = len(chosen)
+        if k == 0 or min(chosen) < 0 or max(chosen) >= n:
+            raise ValueError(f"Combination {sorted(chosen)} is not a non-empty subset of {n} elements")
+        rank = sum(pascal[n][i] for i in range(1, k))
+        left = k
+        for p in range(n):
+            if left == 0:
+                break
+            if p in chosen:
+                left -= 1
+            else:
+                # Every combination that picks p here comes first
+                rank += pascal[n - p - 1][left - 1]
+        return rank
+
+    def unrankVaryingLengthBatch(self, ranks, as_bitmask=False):
+        """Unrank an array of ranks at once.
+
+        Returns boolean membership matrix (len(ranks), n), row i marks the element indices of
+        combination ranks[i]; or, with as_bitmask, the rows packed into uint64 bitsets (see pack_bits).
+        """
+        n = len(self.n_set)
+        pascal, offsets = self._batch_tables()
+        ranks = np.asarray(ranks, dtype=np.int64).ravel()
+        if ranks.size and (ranks.min() < 0 or ranks.max() >= offsets[n + 1]):
+            raise ValueError(f"Ranks must be within [0, {offsets[n + 1]})")
+
+        # Combination length is the first k with more combinations up to it than the rank
+        left = np.searchsorted(offsets[2:], ranks, side="right") + 1
+        x = ranks - offsets[left]
+        masks = np.zeros((len(ranks), n), dtype=bool)
+        for p in range(n):
+            # Combinations taking element p next
+            with_p = pascal[n - p - 1, left - 1]
+            take = (left > 0) & (x < with_p)
+            masks[:, p] = take
+            x = np.where(take | (left == 0), x, x - with_p)
+            left = left - take
+        return pack_bits(masks) if as_bitmask else masks
+
+    def rankVaryingLengthBatch(self, masks):
+        """Inverse of unrankVaryingLengthBatch, masks is a boolean matrix (m, n) or its uint64 bitsets."""
+        n = len(self.n_set)
+        pascal, offsets = self._batch_tables()
+        masks = np.asarray(masks)
+        if masks.dtype != bool:
+            masks = unpack_bits(masks, n)
+        masks = masks.reshape(-1, n)
+        left = masks.sum(axis=1)
+        if (left == 0).any():
+            raise ValueError("Empty combination has no rank")
+        ranks = offsets[left].copy()
+        for p in range(n):
+            skip = ~masks[:, p] & (left > 0)
+            ranks += np.where(skip, pascal[n - p - 1, left - 1], 0)
+            left = left - masks[:, p]
+        return ranks
+
+
+def pack_bits(mask):
+    """Pack boolean array (..., n) into bitsets (..., ceil(n / 64)) of uint64, bit i is stored in word i // 64."""
+    mask = np.asarray(mask, dtype=bool)
+    n = mask.shape[-1]
+    words = max(1, -(-n // 64))
+    padded = np.zeros(mask.shape[:-1] + (words * 64,), dtype=bool)
+    padded[..., :n] = mask
+    return np.packbits(padded, axis=-1, bitorder="little").view("<u8")
+
+
+def unpack_bits(bits, n):
+    """Inverse of pack_bits, returns boolean array (..., n)."""
+    bits = np.ascontiguousarray(bits, dtype="<u8")
+    return np.unpackbits(bits.view(np.uint8), axis=-1, count=n, bitorder="little").astype(bool)
+
+
+def _swar_popcount(words):
+    # Bit counting within each word, for numpy without bitwise_count (< 2.0)
+    words = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    words = (words & np.uint64(0x3333333333333333)) + ((words >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    words = (words + (words >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (words * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+_word_popcount = getattr(np, "bitwise_count", _swar_popcount)
+
+
+def popcount(bits):
+    """Count set bits of bitsets (..., words), summing over the last axis."""
+    counts = _word_popcount(np.asarray(bits, dtype=np.uint64))
+    # Bitsets are a few words long, elementwise adds beat a reduction over such a short axis
+    total = counts[..., 0].astype(np.int64)
+    for word in range(1, counts.shape[-1]):
+        total += counts[..., word]
+    return total
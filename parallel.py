@@ -0,0 +1,112 @@
+"""Monte Carlo sharded over defender strategy ranks on a process pool."""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+import profiling
+import simulation
+from criteria import CriteriaReducer
+
+# Coverage and costs attached in each worker, set once by _attach
+_shared = {}
+
+
+class SharedCoverage:
+    """The part of CoverageIndex simulation needs, backed by arrays in shared memory."""
+
+    def __init__(self, bits, n_techniques):
+        self.bits = bits
+        self.n_techniques = n_techniques
+
+    @property
+    def n_mitigations(self):
+        return self.bits.shape[0]
+
+
+def _share(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach_array(spec):
+    name, shape, dtype = spec
+    # Spawned workers share the parent's resource tracker, the parent unlinks the segment
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _attach(bits_spec, costs_spec, n_techniques):
+    bits_shm, bits = _attach_array(bits_spec)
+    costs_shm, costs = _attach_array(costs_spec)
+    _shared.update(segments=(bits_shm, costs_shm), coverage=SharedCoverage(bits, n_techniques), costs=costs)
+
+
+def _run_shard(criteria, n_simulations, seed, start, stop, k, keep_values, profile=False):
+    reducer = CriteriaReducer(criteria, n_simulations, stop - start, k=k, keep_values=keep_values)
+    shard_profile = profiling.Profile()
+    with shard_profile.activate() if profile else nullcontext():
+        for lo, block in simulation.iter_monte_carlo(_shared["coverage"], _shared["costs"], n_simulations, seed,
+                                                     start, stop):
+            reducer.update(lo - start, block)
+    return start, reducer, shard_profile.to_dict() if profile else None
+
+
+def shards(total, shard_size):
+    """Rank ranges [start, stop) covering [0, total), aligned to whole RNG column chunks."""
+    shard_size = max(simulation.COLUMN_CHUNK, shard_size // simulation.COLUMN_CHUNK * simulation.COLUMN_CHUNK)
+    return [(start, min(start + shard_size, total)) for start in range(0, total, shard_size)]
+
+
+def parallel_monte_carlo(coverage, costs, n_simulations, criteria, seed=None, workers=None, shard_size=None,
+                         k=3, keep_values=True, progress=None):
+    """Monte Carlo with criteria reduction split over a process pool.
+
+    Coverage bitsets and costs are put into shared memory once and attached by every worker at
+    start. Shards are aligned to simulation.COLUMN_CHUNK, so each column uses the same RNG stream
+    as in simulation.monte_carlo and the result does not depend on the number of workers.
+    Returns the merged CriteriaReducer.
+    """
+    if seed is None:
+        seed = simulation.new_seed()
+    workers = workers or os.cpu_count() or 1
+    total = simulation.strategies_count(coverage.n_mitigations)
+    if shard_size is None:
+        # A few shards per worker keeps the pool busy when shards finish unevenly
+        shard_size = -(-total // (workers * 4))
+    reducer = CriteriaReducer(criteria, n_simulations, total, k=k, keep_values=keep_values)
+
+    bits_shm, bits_spec = _share(np.ascontiguousarray(coverage.bits))
+    costs_shm, costs_spec = _share(np.asarray(costs, dtype=float))
+    try:
+        # spawn, as forking the threaded Streamlit server is unsafe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"), initializer=_attach,
+                                 initargs=(bits_spec, costs_spec, coverage.n_techniques)) as pool:
+            # Worker profiles are sent back only when the caller is profiling
+            profile = profiling.current()
+            futures = [pool.submit(_run_shard, criteria, n_simulations, seed, start, stop, k, keep_values,
+                                   profile is not None)
+                       for start, stop in shards(total, shard_size)]
+            done = 0
+            try:
+                for future in as_completed(futures):
+                    start, part, shard_profile = future.result()
+                    reducer.merge(part, start)
+                    if shard_profile is not None:
+                        profile.merge(shard_profile)
+                    done += part.n_columns
+                    if progress is not None:
+                        progress(done / total)
+            except BaseException:
+                # A failing or cancelling progress callback should not wait for the remaining shards
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        for shm in (bits_shm, costs_shm):
+            shm.close()
+            shm.unlink()
+    return reducer
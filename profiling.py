@@ -0,0 +1,137 @@
+"""Per-run instrumentation: phase timings, counters and peaks, optionally a cProfile capture.
+
+Engines record into the profile active in the current context and do nothing when there is none:
+
+    profile = Profile(cprofile=True)
+    with profile.activate():
+        solve_game(...)
+    profile.to_json()
+
+Phases are inclusive wall time summed over their calls, so nested phases overlap. Context does not
+follow work into other threads or processes: a job activates its own profile in its thread, and
+process pools return the profiles of their workers to be merged (worker phases then add up CPU
+time of all workers).
+"""
+import contextvars
+import cProfile
+import io
+import json
+import pstats
+import time
+from contextlib import contextmanager
+
+# Counter divided by phase seconds in the report
+RATES = {
+    "samples_per_second": ("samples", "sampling"),
+    "coverage_checks_per_second": ("coverage_checks", "payoff"),
+    "unranks_per_second": ("unranks", "strategy_enumeration"),
+}
+# Functions listed in the cProfile report
+CPROFILE_LINES = 40
+
+_current = contextvars.ContextVar("profile", default=None)
+
+
+class Profile:
+    def __init__(self, cprofile=False):
+        self.cprofile = cprofile
+        # name -> [seconds, calls]
+        self.phases = {}
+        self.counters = {}
+        self.peaks = {}
+        self.cprofile_stats = None
+
+    def add_phase(self, name, seconds, calls=1):
+        entry = self.phases.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - started)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def peak(self, name, value):
+        if value > self.peaks.get(name, 0):
+            self.peaks[name] = value
+
+    @contextmanager
+    def activate(self):
+        """Make this the profile engines record into, with cProfile running if asked."""
+        token = _current.set(self)
+        profiler = cProfile.Profile() if self.cprofile else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                stream = io.StringIO()
+                pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(CPROFILE_LINES)
+                self.cprofile_stats = (self.cprofile_stats or "") + stream.getvalue()
+            _current.reset(token)
+
+    def merge(self, other):
+        """Add phases, counters and peaks of another profile or of its to_dict()."""
+        if isinstance(other, Profile):
+            other = other.to_dict()
+        for name, phase in other["phases"].items():
+            self.add_phase(name, phase["seconds"], phase["calls"])
+        for name, value in other["counters"].items():
+            self.count(name, value)
+        for name, value in other["peaks"].items():
+            self.peak(name, value)
+
+    def rates(self):
+        rates = {}
+        for rate, (counter, phase) in RATES.items():
+            seconds = self.phases.get(phase, (0.0,))[0]
+            if counter in self.counters and seconds > 0:
+                rates[rate] = self.counters[counter] / seconds
+        return rates
+
+    def to_dict(self):
+        return {
+            "phases": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in self.phases.items()},
+            "counters": dict(self.counters),
+            "peaks": dict(self.peaks),
+            "rates": self.rates(),
+            "cprofile": self.cprofile_stats,
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def phase(name):
+    """Time the block into the active profile, if any."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    with profile.phase(name):
+        yield
+
+
+def count(name, n=1):
+    profile = _current.get()
+    if profile is not None:
+        profile.count(name, n)
+
+
+def peak(name, value):
+    profile = _current.get()
+    if profile is not None:
+        profile.peak(name, value)
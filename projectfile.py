@@ -0,0 +1,177 @@
+"""Project files: settings plus optional stored results, reopened without recomputation.
+
+A project file is an uncompressed zip archive:
+  project.json       - format, ProjectSettings.to_dict() and the results description
+  results/<name>.npy - result arrays in .npy format
+
+Members are stored, not deflated, so every array lies in the file as is. Opening a file reads
+project.json only; an array is memory-mapped (file on disk) or viewed in place (bytes, e.g. an
+upload) the first time it is accessed. A plain JSON file with just the settings is accepted too.
+"""
+import io
+import json
+import struct
+import zipfile
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from numpy.lib import format as npy_format
+from scipy import sparse
+
+from projectsharablestate import ProjectSettings
+
+FORMAT = 1
+SETTINGS_MEMBER = "project.json"
+RESULTS_PREFIX = "results/"
+# Local file header: signature, versions, flags, method, time, date, crc, sizes, then name and extra lengths
+_LOCAL_HEADER = struct.Struct("<4s5H3I2H")
+
+
+def _write_array(archive, name, array):
+    array = np.ascontiguousarray(array)
+    with archive.open(RESULTS_PREFIX + name + ".npy", "w", force_zip64=array.nbytes > 2 ** 31 - 2 ** 20) as member:
+        npy_format.write_array(member, array, allow_pickle=False)
+
+
+def _split(name, value):
+    """Arrays to store for a result and its description in project.json."""
+    if sparse.issparse(value):
+        value = sparse.csc_matrix(value)
+        return {"kind": "csc", "shape": list(value.shape)}, {
+            name + ".data": value.data, name + ".indices": value.indices, name + ".indptr": value.indptr}
+    if isinstance(value, np.ma.MaskedArray):
+        return {"kind": "masked"}, {name: value.filled(0), name + ".mask": np.ma.getmaskarray(value)}
+    return {"kind": "array"}, {name: np.asarray(value)}
+
+
+def save_project(target, settings, results=None, results_meta=None):
+    """Write a project file to a path or a binary file object.
+
+    results maps a name to an ndarray, a masked array or a scipy sparse matrix; results_meta is any
+    JSON-friendly description of the run (algorithm, simulations, ...).
+    """
+    description = {}
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, value in (results or {}).items():
+            if value is None:
+                continue
+            description[name], arrays = _split(name, value)
+            for member_name, array in arrays.items():
+                _write_array(archive, member_name, array)
+        archive.writestr(SETTINGS_MEMBER, json.dumps({
+            "format": FORMAT,
+            "settings": settings.to_dict(),
+            "results": {"meta": results_meta or {}, "arrays": description} if description else None,
+        }, ensure_ascii=False))
+
+
+def project_bytes(settings, results=None, results_meta=None):
+    buffer = io.BytesIO()
+    save_project(buffer, settings, results, results_meta)
+    return buffer.getvalue()
+
+
+class StoredResults(Mapping):
+    """Lazily opened result arrays of a project file, keyed by the names given to save_project."""
+
+    def __init__(self, archive_source, members, meta, description):
+        self._source = archive_source
+        self._members = members
+        self.meta = meta
+        self._description = description
+        self._arrays = {}
+        self._loaded = {}
+
+    def _array(self, member_name):
+        array = self._arrays.get(member_name)
+        if array is None:
+            array = self._source.array(self._members[RESULTS_PREFIX + member_name + ".npy"])
+            self._arrays[member_name] = array
+        return array
+
+    def __getitem__(self, name):
+        if name not in self._loaded:
+            entry = self._description[name]
+            if entry["kind"] == "csc":
+                value = sparse.csc_matrix((self._array(name + ".data"), self._array(name + ".indices"),
+                                           self._array(name + ".indptr")), shape=tuple(entry["shape"]), copy=False)
+            elif entry["kind"] == "masked":
+                value = np.ma.MaskedArray(self._array(name), mask=self._array(name + ".mask"), copy=False)
+            else:
+                value = self._array(name)
+            self._loaded[name] = value
+        return self._loaded[name]
+
+    def __iter__(self):
+        return iter(self._description)
+
+    def __len__(self):
+        return len(self._description)
+
+
+class _ArchiveSource:
+    """Locates stored members inside the archive and exposes their .npy payload without copying."""
+
+    def __init__(self, path=None, data=None):
+        self.path = path
+        self.data = data
+
+    def open(self):
+        return open(self.path, "rb") if self.path is not None else io.BytesIO(self.data)
+
+    def array(self, info):
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(f"{info.filename} is compressed and cannot be mapped")
+        with self.open() as f:
+            f.seek(info.header_offset)
+            header = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+            name_length, extra_length = header[-2], header[-1]
+            f.seek(info.header_offset + _LOCAL_HEADER.size + name_length + extra_length)
+            version = npy_format.read_magic(f)
+            read_header = npy_format.read_array_header_1_0 if version == (1, 0) else npy_format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            offset = f.tell()
+        order = "F" if fortran_order else "C"
+        count = int(np.prod(shape))
+        if count == 0:
+            return np.zeros(shape, dtype=dtype, order=order)
+        if self.path is not None:
+            return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=shape, order=order)
+        return np.frombuffer(self.data, dtype=dtype, count=count, offset=offset).reshape(shape, order=order)
+
+
+@dataclass
+class ProjectFile:
+    settings: ProjectSettings
+    results: Optional[StoredResults] = None
+
+
+def load_project(source):
+    """Open a project file from a path or bytes; result arrays stay on disk until used."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+        is_archive = zipfile.is_zipfile(io.BytesIO(data))
+        archive_source = _ArchiveSource(data=data) if is_archive else None
+    else:
+        is_archive = zipfile.is_zipfile(source)
+        archive_source = _ArchiveSource(path=source) if is_archive else None
+        if not is_archive:
+            with open(source, "rb") as f:
+                data = f.read()
+
+    if not is_archive:
+        document = json.loads(data)
+        return ProjectFile(ProjectSettings.from_dict(document.get("settings", document)))
+
+    with zipfile.ZipFile(archive_source.open()) as archive:
+        members = {info.filename: info for info in archive.infolist()}
+        document = json.loads(archive.read(SETTINGS_MEMBER))
+    if document.get("format", FORMAT) > FORMAT:
+        raise ValueError(f"Project file format {document['format']} is newer than supported {FORMAT}")
+
+    results = None
+    if document.get("results"):
+        results = StoredResults(archive_source, members, document["results"]["meta"], document["results"]["arrays"])
+    return ProjectFile(ProjectSettings.from_dict(document["settings"]), results)
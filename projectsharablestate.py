@@ -1,10 +1,12 @@
 from dataclasses import dataclass, field
-from typing import List
+from typing import Dict, List, Optional
 from enum import Enum
 import numpy as np
-from typing import Callable
+from typing import Callable, TYPE_CHECKING
 
-from intvalpy import Interval
+if TYPE_CHECKING:
+    # intvalpy takes most of the import time, it is loaded when an interval is first built
+    from intvalpy import Interval
 
 
 class DefenderCriteria(Enum):
@@ -62,6 +64,19 @@ class AttackerCriteria(Enum):
 class GameAlgorithm(Enum):
     MonteCarlo = ("Монте-Карло", "plainrandommontecarlo")
     UpperConfidenceBound = ("Upper-Confidence-Bound", "ucb")
+    Analytic = ("Точный расчёт без симуляций", "analytic")
+    Optimization = ("Поиск оптимальной стратегии (MILP)", "milp")
+    DoubleOracle = ("Равновесие в смешанных стратегиях (Double Oracle)", "doubleoracle")
+    Racing = ("Монте-Карло с отсевом стратегий (Racing)", "racing")
+
+    def __str__(self):
+        return str(self.value[0])
+
+
+class SamplingMode(Enum):
+    Independent = ("Свои случайные атаки для каждой стратегии", "independent")
+    Common = ("Общие случайные атаки для всех стратегий", "common")
+    Sobol = ("Общие квазислучайные атаки (Соболь)", "sobol")
 
     def __str__(self):
         return str(self.value[0])
@@ -71,7 +86,7 @@ class GameAlgorithm(Enum):
 class AppEntry:
     app_name: str
     app_price: str
-    app_loss: Interval
+    app_loss: 'Interval'
     app_mitigations: List[str] = field(default_factory=list)
 
     def as_dict(self):
@@ -81,13 +96,107 @@ class AppEntry:
     def is_mitigation_present(self, mitigation_id: str) -> bool:
         return mitigation_id in self.app_mitigations
 
+    def to_dict(self) -> dict:
+        """JSON-friendly form, the loss interval is kept as its [lower, upper] bounds."""
+        return {'app_name': self.app_name, 'app_price': self.app_price,
+                'app_loss': [float(self.app_loss.a), float(self.app_loss.b)],
+                'app_mitigations': list(self.app_mitigations)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'AppEntry':
+        from intvalpy import Interval
+
+        lower, upper = data['app_loss']
+        return cls(app_name=data['app_name'], app_price=data['app_price'], app_loss=Interval(lower, upper),
+                   app_mitigations=list(data.get('app_mitigations', [])))
+
+
+@dataclass
+class CostTable:
+    """Price of every mitigation (app prices plus mid of summed losses) and apps implementing it."""
+    prices: Dict[str, float] = field(default_factory=dict)
+    apps: Dict[str, List[AppEntry]] = field(default_factory=dict)
+
+    @classmethod
+    def from_apps(cls, defender_apps: List[AppEntry]) -> 'CostTable':
+        from intvalpy import Interval
+
+        table = cls()
+        losses = {}
+        for app in defender_apps:
+            for mitigation_id in dict.fromkeys(app.app_mitigations):
+                table.prices[mitigation_id] = table.prices.get(mitigation_id, 0) + app.app_price
+                losses[mitigation_id] = losses.get(mitigation_id, Interval(0, 0)) + app.app_loss
+                table.apps.setdefault(mitigation_id, []).append(app)
+        for mitigation_id, loss in losses.items():
+            table.prices[mitigation_id] += loss.mid.real
+        return table
+
+    def price(self, mitigation_id: str) -> float:
+        return self.prices.get(mitigation_id, 0)
+
+    def cost_vector(self, mitigation_ids: List[str]) -> np.ndarray:
+        return np.array([self.price(m_id) for m_id in mitigation_ids], dtype=float)
+
+    def apps_for(self, mitigation_ids: List[str]) -> List[AppEntry]:
+        """Apps implementing any of the mitigations, in order of first appearance."""
+        result = []
+        for mitigation_id in mitigation_ids:
+            for app in self.apps.get(mitigation_id, []):
+                if app not in result:
+                    result.append(app)
+        return result
+
 
 @dataclass
 class ProjectSettings:
     mitre_domain: str
     mitre_version: str
     attacker_max_interval: int
-    attacker_criteria: AttackerCriteria
+    attacker_criteria: Optional[AttackerCriteria]
     defender_criteria: DefenderCriteria
     attacker_tactics: List[str] = field(default_factory=list)
     defender_apps: List[AppEntry] = field(default_factory=list)
+    # Bumped on every change of defender_apps, cost_table() is rebuilt when it moves
+    revision: int = field(default=0, compare=False)
+    _cost_table: Optional[CostTable] = field(default=None, init=False, repr=False, compare=False)
+    _cost_table_revision: int = field(default=-1, init=False, repr=False, compare=False)
+
+    def add_app_entry(self, entry: AppEntry):
+        self.defender_apps.append(entry)
+        self.revision += 1
+
+    def replace_app_entry(self, index: int, entry: AppEntry):
+        self.defender_apps[index] = entry
+        self.revision += 1
+
+    def to_dict(self) -> dict:
+        """JSON-friendly form, enums are stored by member name."""
+        return {
+            'mitre_domain': self.mitre_domain,
+            'mitre_version': self.mitre_version,
+            'attacker_max_interval': self.attacker_max_interval,
+            'attacker_criteria': self.attacker_criteria.name if self.attacker_criteria else None,
+            'defender_criteria': self.defender_criteria.name,
+            'attacker_tactics': list(self.attacker_tactics),
+            'defender_apps': [app.to_dict() for app in self.defender_apps],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ProjectSettings':
+        attacker_criteria = data.get('attacker_criteria')
+        return cls(
+            mitre_domain=data['mitre_domain'],
+            mitre_version=data['mitre_version'],
+            attacker_max_interval=data.get('attacker_max_interval', 1000),
+            attacker_criteria=AttackerCriteria[attacker_criteria] if attacker_criteria else None,
+            defender_criteria=DefenderCriteria[data['defender_criteria']],
+            attacker_tactics=list(data.get('attacker_tactics', [])),
+            defender_apps=[AppEntry.from_dict(app) for app in data.get('defender_apps', [])],
+        )
+
+    def cost_table(self) -> CostTable:
+        if self._cost_table is None or self._cost_table_revision != self.revision:
+            self._cost_table = CostTable.from_apps(self.defender_apps)
+            self._cost_table_revision = self.revision
+        return self._cost_table
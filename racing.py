@@ -0,0 +1,141 @@
+"""Racing: Monte Carlo with successive elimination of defender strategies.
+
+Plain Monte Carlo gives every one of the 2^S - 1 strategies the same number of simulations. Racing
+samples in rounds, doubling the simulations of the strategies still in the race each round, and
+drops a strategy as soon as its confidence interval lies entirely above the k-th best upper bound.
+It stops once only k strategies are left (the top k is certified at the given confidence) or the
+survivors reach max_simulations (not certified, ties and near-ties cannot be separated).
+
+Intervals are empirical Bernstein bounds (Maurer & Pontil, 2009). A payoff a(j, A) lies in
+[0, R_j] with R_j = a(j, all techniques) known in closed form (see analytic), so strategies with
+cheap mitigations or a small variance are separated quickly. The failure probability is split
+between strategies and rounds (delta_r = delta / (M * r * (r + 1))), so the guarantee holds for
+the whole race. Only the Laplace criterion (mean payoff) is raced: Wald and Savage are extremes
+of the sample, which confidence intervals do not bound, and are exact without sampling anyway.
+"""
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+import analytic
+import profiling
+from criteria import TopK
+from maths import CombinationGenerator
+from projectsharablestate import DefenderCriteria
+from simulation import COLUMN_CHUNK, new_seed, payoff, sample_attacks, strategies_count, strategy_masks
+
+# Attack words sampled at once: columns of a block times simulations of the round
+BLOCK_CELLS = 2 ** 21
+
+
+@dataclass
+class RacingStats:
+    # Payoff samples drawn over all strategies, plain Monte Carlo needs strategies * max_simulations
+    simulations: int = 0
+    rounds: int = 0
+    # Simulations of each strategy that stayed to the end
+    final_simulations: int = 0
+    survivors: int = 0
+    certified: bool = False
+
+
+def racing_rng(seed):
+    # (0, 1) never collides with the spawn keys of simulation and incremental
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(0, 1)))
+
+
+def payoff_ranges(coverage, costs):
+    """R_j = payoff of every strategy against the full technique set."""
+    total = strategies_count(coverage.n_mitigations)
+    ranges = np.zeros(total)
+    for start in range(0, total, 16 * COLUMN_CHUNK):
+        stop = min(start + 16 * COLUMN_CHUNK, total)
+        ranges[start:stop] = analytic.technique_costs(
+            coverage, costs, strategy_masks(coverage.n_mitigations, start, stop)).sum(axis=1)
+    return ranges
+
+
+def bernstein_radius(variance, ranges, n, delta):
+    """Two-sided empirical Bernstein half-width of means of n samples in [0, ranges]."""
+    log_term = math.log(4 / delta)
+    return np.sqrt(2 * variance * log_term / n) + 7 * ranges * log_term / (3 * (n - 1))
+
+
+def racing(coverage, costs, criteria, reducer, max_simulations, confidence=0.95, k=1, initial=8, seed=None,
+           progress=None):
+    """Race every defender strategy, filling reducer (criteria.CriteriaReducer) with the survivors.
+
+    reducer.top holds the best survivors by mean after every round, filled up with the best
+    eliminated strategies (by the mean of the simulations they got) when fewer survivors are left,
+    reducer.values (if kept) that mean for every strategy, masked for strategies that can never pay.
+    Returns RacingStats.
+    """
+    if criteria != DefenderCriteria.LAPLACE_REASON:
+        raise ValueError("Racing only supports the Laplace criterion")
+    if not 0 < confidence < 1:
+        raise ValueError("Confidence must be between 0 and 1")
+    if k < 1:
+        raise ValueError("At least one strategy must be certified")
+    if seed is None:
+        seed = new_seed()
+    costs = np.asarray(costs, dtype=float)
+    resolver = CombinationGenerator(range(coverage.n_mitigations))
+    rng = racing_rng(seed)
+
+    ranges = payoff_ranges(coverage, costs)
+    # Strategies that never pay are masked by every engine and do not race
+    active = np.flatnonzero(ranges > 0)
+    sums = np.zeros(len(ranges))
+    squares = np.zeros(len(ranges))
+    counts = np.zeros(len(ranges), dtype=np.int64)
+    delta = 1 - confidence
+    candidates = max(len(active), 1)
+    stats = RacingStats()
+
+    n = 0
+    while len(active) and n < max_simulations:
+        stats.rounds += 1
+        batch = min(max(initial - n, n), max_simulations - n)
+        block = max(1, BLOCK_CELLS // batch)
+        for lo in range(0, len(active), block):
+            ranks = active[lo:lo + block]
+            attacks = sample_attacks(rng, coverage.n_techniques, (batch, len(ranks)))
+            values = payoff(coverage, costs, resolver.unrankVaryingLengthBatch(ranks), attacks)
+            sums[ranks] += values.sum(axis=0)
+            squares[ranks] += np.square(values).sum(axis=0)
+            counts[ranks] += batch
+            profiling.count("unranks", len(ranks))
+            if progress is not None:
+                progress((n + batch * min(lo + block, len(active)) / len(active)) / max_simulations)
+        n += batch
+        stats.simulations += batch * len(active)
+
+        means = sums[active] / n
+        if n > 1:
+            variance = np.maximum(squares[active] / n - np.square(means), 0) * n / (n - 1)
+            radius = bernstein_radius(variance, ranges[active], n,
+                                      delta / (candidates * stats.rounds * (stats.rounds + 1)))
+            upper = means + radius
+            if len(active) > k:
+                threshold = np.partition(upper, k - 1)[k - 1]
+                keep = means - radius <= threshold
+                active = active[keep]
+
+        # Survivors first, eliminated strategies only fill the places left
+        raced = np.flatnonzero(counts)
+        raced_means = sums[raced] / counts[raced]
+        order = np.lexsort((raced_means, ~np.isin(raced, active)))[:reducer.top.k]
+        reducer.top = TopK(reducer.top.k)
+        for position in order:
+            reducer.top.push(int(raced[position]), float(raced_means[position]))
+        if len(active) <= k:
+            break
+
+    stats.final_simulations = n
+    stats.survivors = len(active)
+    stats.certified = 0 < len(active) <= k
+    if reducer.values is not None:
+        # Eliminated strategies keep the mean of the simulations they got
+        reducer.values[:] = np.ma.masked_array(sums / np.maximum(counts, 1), mask=counts == 0)
+    return stats
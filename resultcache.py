@@ -0,0 +1,151 @@
+"""Content-addressed cache of simulation results.
+
+Results are keyed by a hash of everything they depend on: project settings (ATT&CK domain and
+version, tactics, apps, criteria), algorithm, number of simulations, UCB parameter and seed.
+Recent results are kept in memory with LRU eviction by size, evicted ones are spilled to a
+directory of project files (see projectfile) that is itself trimmed to a size limit, least
+recently used first. One cache is meant to be shared by every session of a server process.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+
+import projectfile
+import stixcache
+
+KEY_FORMAT = 1
+# Algorithms whose results do not depend on the seed
+DETERMINISTIC_ALGORITHMS = ("Analytic", "Optimization", "DoubleOracle")
+
+
+def default_results_dir():
+    return os.path.join(stixcache.default_cache_dir(), "results")
+
+
+def result_key(settings, algorithm, n_simulations, b=None, seed=None, options=None):
+    """Hash of the inputs of a run; None when the run is not reproducible (random seed).
+
+    options holds algorithm specific parameters (e.g. Racing confidence), left out of the hash when empty.
+    """
+    deterministic = algorithm.name in DETERMINISTIC_ALGORITHMS
+    if seed is None and not deterministic:
+        return None
+    document = {
+        "format": KEY_FORMAT,
+        "settings": settings.to_dict(),
+        "algorithm": algorithm.name,
+        "simulations": n_simulations,
+        "b": b if algorithm.name == "UpperConfidenceBound" else None,
+        "seed": None if deterministic else seed,
+    }
+    if options:
+        document["options"] = options
+    return hashlib.sha256(json.dumps(document, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def results_nbytes(results):
+    total = 0
+    for value in results.values():
+        if value is None:
+            continue
+        if sparse.issparse(value):
+            value = sparse.csc_matrix(value)
+            total += value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+        else:
+            total += np.asarray(value).nbytes + (np.ma.getmaskarray(value).nbytes if np.ma.isMaskedArray(value) else 0)
+    return total
+
+
+class ResultCache:
+    """Thread-safe LRU of (results, meta) by key, bounded in bytes, spilling evicted entries to disk."""
+
+    def __init__(self, memory_bytes=256 * 2 ** 20, disk_dir=None, disk_bytes=2 * 2 ** 30):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self._entries = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key + ".gts")
+
+    def get(self, key):
+        """(results, meta) stored under key or None; results read back from disk stay memory-mapped."""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0], entry[1]
+        if self.disk_dir is None or not os.path.isfile(self._path(key)):
+            return None
+        try:
+            stored = projectfile.load_project(self._path(key)).results
+            # Access time drives trimming of the disk store
+            os.utime(self._path(key))
+        except (OSError, ValueError, KeyError):
+            return None
+        if stored is None:
+            return None
+        return dict(stored), stored.meta
+
+    def put(self, key, results, meta, settings):
+        if key is None:
+            return
+        size = results_nbytes(results)
+        spilled = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._used -= previous[3]
+            self._entries[key] = (results, meta, settings, size)
+            self._used += size
+            while self._used > self.memory_bytes and len(self._entries) > 1:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._used -= evicted[3]
+                spilled.append((evicted_key, evicted))
+        for evicted_key, (evicted_results, evicted_meta, evicted_settings, _) in spilled:
+            self._spill(evicted_key, evicted_results, evicted_meta, evicted_settings)
+
+    def _spill(self, key, results, meta, settings):
+        if self.disk_dir is None:
+            return
+        os.makedirs(self.disk_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".spill-", dir=self.disk_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                projectfile.save_project(out, settings, results, meta)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".gts"):
+                stat = os.stat(os.path.join(self.disk_dir, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.unlink(os.path.join(self.disk_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._used = 0
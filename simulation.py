@@ -0,0 +1,339 @@
+"""Simulation engines for the defender payoff matrix, usable outside of Streamlit.
+
+Payoff of defender strategy j against attack A is the sum of mitigation costs over every covered
+(mitigation, technique) pair, same as the original per-cell loops:
+
+    a(j, A) = sum over m in j of cost_m * |coverage_m & A|
+
+Attacks are drawn uniformly over non-empty technique subsets, i.e. a uniform rank in [0, 2^T - 1).
+Strategies are columns ordered by `CombinationGenerator` rank.
+"""
+import heapq
+import math
+
+import numpy as np
+from scipy import sparse
+
+import profiling
+from maths import CombinationGenerator, pack_bits, popcount
+
+# Columns sharing one RNG stream. Streams are keyed by (seed, chunk number), so a column always
+# gets the same samples whichever range of columns is computed
+COLUMN_CHUNK = 256
+# Columns computed at once with common random numbers, where a block is a single matrix product
+COMMON_BLOCK = 16 * COLUMN_CHUNK
+
+
+def strategies_count(n):
+    return 2 ** n - 1
+
+
+def strategy_masks(n, start, stop):
+    """Boolean membership matrix (stop - start, n) of strategies with ranks in [start, stop)."""
+    profiling.count("unranks", stop - start)
+    with profiling.phase("strategy_enumeration"):
+        return CombinationGenerator(range(n)).unrankVaryingLengthBatch(np.arange(start, stop))
+
+
+def new_seed():
+    return np.random.SeedSequence().entropy
+
+
+def chunk_rng(seed, chunk):
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk,)))
+
+
+def sequential_rng(seed):
+    # Two-element spawn key never collides with the (chunk,) keys of column streams
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(0, 0)))
+
+
+def common_rng(seed):
+    # (0, 2) never collides with the streams above, racing or incremental
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(0, 2)))
+
+
+def sample_attacks(rng, n_techniques, shape):
+    """Uniform non-empty technique subsets as bitsets (*shape, words)."""
+    words = max(1, -(-n_techniques // 64))
+    tail_mask = np.uint64((1 << (n_techniques % 64)) - 1) if n_techniques % 64 else np.uint64(2 ** 64 - 1)
+
+    def draw(size):
+        bits = rng.integers(np.iinfo(np.uint64).max, size=size + (words,), dtype=np.uint64, endpoint=True)
+        bits[..., -1] &= tail_mask
+        return bits
+
+    attacks = draw(tuple(shape))
+    # Rejection of the empty set keeps the distribution uniform over the 2^T - 1 ranks
+    empty = popcount(attacks) == 0
+    while empty.any():
+        attacks[empty] = draw((int(empty.sum()),))
+        empty = popcount(attacks) == 0
+    return attacks
+
+
+def sobol_attacks(rng, n_techniques, n_simulations):
+    """Attack bitsets (n_simulations, words) from scrambled Sobol points thresholded at 1/2.
+
+    Every technique, and every pair of techniques, is in a balanced share of the attacks; balance
+    is exact for a power of two simulations. Empty sets are dropped like in sample_attacks.
+    """
+    from scipy.stats import qmc
+
+    sobol = qmc.Sobol(d=n_techniques, scramble=True, seed=rng)
+    points = sobol.random_base2(max(0, (n_simulations - 1).bit_length()))
+    while True:
+        attacks = points >= 0.5
+        attacks = attacks[attacks.any(axis=1)]
+        if len(attacks) >= n_simulations:
+            return pack_bits(attacks[:n_simulations])
+        # Doubling keeps the number of drawn points a power of two
+        points = np.concatenate([points, sobol.random(len(points))])
+
+
+def payoff(coverage, costs, strategies, attacks):
+    """Payoff of every strategy against its own attacks.
+
+    strategies is a boolean matrix (columns, mitigations), attacks bitsets (simulations, columns, words);
+    returns float matrix (simulations, columns).
+    """
+    result = np.zeros(attacks.shape[:2])
+    weights = strategies * np.asarray(costs, dtype=float)
+    with profiling.phase("payoff"):
+        for m in range(coverage.n_mitigations):
+            if not weights[:, m].any():
+                continue
+            result += popcount(attacks & coverage.bits[m]) * weights[:, m]
+    profiling.count("coverage_checks", result.size * int(weights.any(axis=0).sum()))
+    return result
+
+
+def chunk_attacks(n_techniques, n_simulations, seed, chunk, total):
+    """Attacks (simulations, columns of the chunk, words) of one column chunk out of total columns."""
+    chunk_start = chunk * COLUMN_CHUNK
+    chunk_stop = min(chunk_start + COLUMN_CHUNK, total)
+    profiling.count("samples", n_simulations * (chunk_stop - chunk_start))
+    with profiling.phase("sampling"):
+        return sample_attacks(chunk_rng(seed, chunk), n_techniques, (n_simulations, chunk_stop - chunk_start))
+
+
+def iter_monte_carlo(coverage, costs, n_simulations, seed, start=0, stop=None):
+    """Yield (first column, block of payoffs (simulations, columns)) for columns [start, stop)."""
+    total = strategies_count(coverage.n_mitigations)
+    if stop is None:
+        stop = total
+    for chunk in range(start // COLUMN_CHUNK, -(-stop // COLUMN_CHUNK)):
+        chunk_start = chunk * COLUMN_CHUNK
+        chunk_stop = min(chunk_start + COLUMN_CHUNK, total)
+        attacks = chunk_attacks(coverage.n_techniques, n_simulations, seed, chunk, total)
+        lo, hi = max(start, chunk_start), min(stop, chunk_stop)
+        strategies = strategy_masks(coverage.n_mitigations, lo, hi)
+        yield lo, payoff(coverage, costs, strategies, attacks[:, lo - chunk_start:hi - chunk_start])
+
+
+class CooBuilder:
+    """Collects non-zero cells of payoff blocks into a sparse matrix."""
+
+    def __init__(self, shape):
+        self.shape = shape
+        self._rows, self._cols, self._values = [], [], []
+
+    def add(self, start, block):
+        rows, cols = np.nonzero(block)
+        self._rows.append(rows)
+        self._cols.append(cols + start)
+        self._values.append(block[rows, cols])
+
+    def tocoo(self):
+        if not self._rows:
+            return sparse.coo_matrix(self.shape)
+        return sparse.coo_matrix((np.concatenate(self._values),
+                                  (np.concatenate(self._rows), np.concatenate(self._cols))), shape=self.shape)
+
+    def tocsc(self):
+        return self.tocoo().tocsc()
+
+
+def monte_carlo(coverage, costs, n_simulations, seed=None, start=0, stop=None, progress=None,
+                reducer=None, keep_matrix=True, sparse_output=False):
+    """Plain Monte Carlo: every defender strategy gets n_simulations independent random attacks.
+
+    Returns the payoff matrix (n_simulations, stop - start), as CSC with sparse_output. Blocks are
+    also fed to reducer (criteria.CriteriaReducer) if given; without keep_matrix the matrix is never
+    built and None is returned. progress, if given, is called with the done fraction after every block.
+    """
+    if seed is None:
+        seed = new_seed()
+    total = strategies_count(coverage.n_mitigations)
+    if stop is None:
+        stop = total
+    if not 0 <= start <= stop <= total:
+        raise ValueError(f"Strategy range [{start}, {stop}) is outside of [0, {total})")
+    matrix = builder = None
+    if keep_matrix and sparse_output:
+        builder = CooBuilder((n_simulations, stop - start))
+    elif keep_matrix:
+        matrix = np.zeros((n_simulations, stop - start))
+    for lo, block in iter_monte_carlo(coverage, costs, n_simulations, seed, start, stop):
+        if matrix is not None:
+            matrix[:, lo - start:lo - start + block.shape[1]] = block
+        if builder is not None:
+            builder.add(lo - start, block)
+        if reducer is not None:
+            reducer.update(lo, block)
+        if progress is not None:
+            progress((lo - start + block.shape[1]) / max(stop - start, 1))
+    if builder is not None:
+        matrix = builder.tocsc()
+        profiling.peak("payoff_matrix_bytes", matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes)
+    elif matrix is not None:
+        profiling.peak("payoff_matrix_bytes", matrix.nbytes)
+    return matrix
+
+
+def common_monte_carlo(coverage, costs, n_simulations, seed=None, sobol=False, start=0, stop=None, progress=None,
+                       reducer=None, keep_matrix=True, sparse_output=False):
+    """Monte Carlo with common random numbers: the same n_simulations attacks against every strategy.
+
+    Attacks are drawn once (scrambled Sobol points with sobol) instead of once per strategy, and
+    payoffs of a block of strategies are one product of covered pairs weighted by cost,
+    (simulations, mitigations), with the membership matrix (mitigations, columns). Differences
+    between strategies no longer carry the noise of different attacks, so comparisons between
+    them need fewer simulations. Same arguments and result as monte_carlo.
+    """
+    if seed is None:
+        seed = new_seed()
+    total = strategies_count(coverage.n_mitigations)
+    if stop is None:
+        stop = total
+    if not 0 <= start <= stop <= total:
+        raise ValueError(f"Strategy range [{start}, {stop}) is outside of [0, {total})")
+    rng = common_rng(seed)
+    profiling.count("samples", n_simulations)
+    with profiling.phase("sampling"):
+        if sobol:
+            attacks = sobol_attacks(rng, coverage.n_techniques, n_simulations)
+        else:
+            attacks = sample_attacks(rng, coverage.n_techniques, (n_simulations,))
+    with profiling.phase("payoff"):
+        weighted = coverage.pair_counts(attacks) * np.asarray(costs, dtype=float)
+    profiling.count("coverage_checks", n_simulations * coverage.n_mitigations)
+
+    matrix = builder = None
+    if keep_matrix and sparse_output:
+        builder = CooBuilder((n_simulations, stop - start))
+    elif keep_matrix:
+        matrix = np.zeros((n_simulations, stop - start))
+    for lo in range(start, stop, COMMON_BLOCK):
+        hi = min(lo + COMMON_BLOCK, stop)
+        strategies = strategy_masks(coverage.n_mitigations, lo, hi)
+        with profiling.phase("payoff"):
+            block = weighted @ strategies.T.astype(float)
+        if matrix is not None:
+            matrix[:, lo - start:hi - start] = block
+        if builder is not None:
+            builder.add(lo - start, block)
+        if reducer is not None:
+            reducer.update(lo, block)
+        if progress is not None:
+            progress((hi - start) / max(stop - start, 1))
+    if builder is not None:
+        matrix = builder.tocsc()
+        profiling.peak("payoff_matrix_bytes", matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes)
+    elif matrix is not None:
+        profiling.peak("payoff_matrix_bytes", matrix.nbytes)
+    return matrix
+
+
+# mean_x_yi - текущее среднее значение для стратегии y_i
+# n_yi  = уже проведенные симуляции
+def calc_radical_ucb(mean_x_yi, n_yi, n, b):
+    return mean_x_yi - (b * math.sqrt((2 * math.log(n)) / n_yi))
+
+
+def ucb(coverage, costs, n_simulations, b, seed=None, progress=None, attack_batch=1024):
+    """Upper-Confidence-Bound (lower bound, as payoffs are minimised) over all defender strategies.
+
+    Every strategy is pulled once, results go to row 0. Then on step n = 1 .. n_simulations - 1 the
+    strategy with the lowest radical is pulled and its result goes to row n. Means ignore zero
+    results, like np.ma.masked_equal(column, 0) did; a strategy without non-zero results has mean 0.
+
+    Only the pulled strategy is updated per step: running sums and counts are kept per strategy.
+    Strategies with the same number of pulls share the exploration term, so within such a group
+    the lowest radical is the lowest mean whatever n is. Every group keeps its strategies in a heap
+    by (mean, rank), and a step compares only the group minima, with radicals at the current n like
+    the argmin over all strategies (ties to the lowest rank). Groups are distinct pull counts, so
+    there are O(sqrt(n_simulations)) of them.
+
+    Returns a sparse COO matrix (n_simulations, strategies) holding one entry per pull.
+    """
+    if n_simulations < 1:
+        raise ValueError("UCB needs at least one simulation")
+    if seed is None:
+        seed = new_seed()
+    costs = np.asarray(costs, dtype=float)
+    total = strategies_count(coverage.n_mitigations)
+    resolver = CombinationGenerator(range(coverage.n_mitigations))
+
+    rows = np.zeros(total + max(n_simulations - 1, 0), dtype=np.int64)
+    cols = np.zeros_like(rows)
+    values = np.zeros(len(rows))
+    profiling.peak("payoff_matrix_bytes", rows.nbytes + cols.nbytes + values.nbytes)
+
+    # Non-zero results sum and count, total pulls per strategy
+    sums = np.zeros(total)
+    nonzero = np.zeros(total, dtype=np.int64)
+    pulls = np.ones(total, dtype=np.int64)
+
+    # Initial pull of every strategy, done in blocks like a single Monte Carlo simulation
+    for lo, block in iter_monte_carlo(coverage, costs, 1, seed):
+        hi = lo + block.shape[1]
+        cols[lo:hi] = np.arange(lo, hi)
+        values[lo:hi] = block[0]
+    sums[:] = values[:total]
+    nonzero[:] = values[:total] != 0
+
+    def mean(j):
+        return sums[j] / nonzero[j] if nonzero[j] else 0.0
+
+    # pulls -> heap of (mean, rank) of the strategies pulled that many times
+    means = np.divide(sums, nonzero, out=np.zeros(total), where=nonzero > 0)
+    groups = {1: list(zip(means.tolist(), range(total)))}
+    heapq.heapify(groups[1])
+
+    rng = sequential_rng(seed)
+    attacks = np.zeros((0, 1))
+    report_every = max(1, n_simulations // 100)
+    for n_yi in range(1, n_simulations):
+        # Радикалы пересчитываются после каждого шага, поэтому выбор на шаге n_yi идёт по n = n_yi - 1
+        n = max(n_yi - 1, 1)
+        # Стратегия защиты с наименьшим радикалом: наименьшее среднее в каждой группе
+        best = min((calc_radical_ucb(heap[0][0], group_pulls, n, b), heap[0][1], group_pulls)
+                   for group_pulls, heap in groups.items())
+        current_j, group_pulls = best[1], best[2]
+        heapq.heappop(groups[group_pulls])
+        if not groups[group_pulls]:
+            del groups[group_pulls]
+
+        if len(attacks) == 0:
+            with profiling.phase("sampling"):
+                attacks = coverage.pair_counts(sample_attacks(rng, coverage.n_techniques, (attack_batch,)))
+            profiling.count("samples", attack_batch)
+            profiling.count("coverage_checks", attack_batch * coverage.n_mitigations)
+        mitigated, attacks = attacks[0], attacks[1:]
+        mitig_comb = resolver.unrankVaryingLengthCombination(current_j)
+        value = float(mitigated[mitig_comb] @ costs[mitig_comb])
+
+        at = total + n_yi - 1
+        rows[at], cols[at], values[at] = n_yi, current_j, value
+        pulls[current_j] += 1
+        if value:
+            sums[current_j] += value
+            nonzero[current_j] += 1
+        heapq.heappush(groups.setdefault(int(pulls[current_j]), []), (mean(current_j), current_j))
+
+        if progress is not None and n_yi % report_every == 0:
+            progress(n_yi / n_simulations)
+
+    profiling.count("unranks", max(n_simulations - 1, 0))
+    return sparse.coo_matrix((values, (rows, cols)), shape=(n_simulations, total))
@@ -0,0 +1,80 @@
+"""Best defender strategies as an integer program instead of enumerating all 2^S - 1 combinations.
+
+Works on the exact criteria values (see analytic), x_m = 1 when the mitigation at position m is
+in the strategy and w_m = cost_m * (techniques covered by m):
+
+  Laplace  min p * w.x        Wald  min w.x
+  Savage   min w.x - z,       z <= sum over m of cost_m * [m covers t] * x_m for every technique t
+
+Laplace and Wald mask zero values, so w.x has to reach the smallest positive w_m; this assumes
+non-negative prices and losses. Alternatives come from re-solving with a no-good cut on every
+found combination.
+"""
+import numpy as np
+from scipy.optimize import Bounds, LinearConstraint, milp
+
+from analytic import inclusion_probability
+from maths import CombinationGenerator
+from projectsharablestate import DefenderCriteria
+
+
+def _problem(coverage, costs, criteria):
+    """Objective, constraints and variable count; x is followed by z for Savage."""
+    per_technique = np.asarray(costs, dtype=float)[:, np.newaxis] * coverage.matrix
+    weights = per_technique.sum(axis=1)
+    n = coverage.n_mitigations
+    # Non-empty strategy
+    constraints = [LinearConstraint(np.ones((1, n)), lb=1)]
+
+    if criteria in (DefenderCriteria.LAPLACE_REASON, DefenderCriteria.WALD_MAXIMIN):
+        scale = inclusion_probability(coverage.n_techniques) if criteria == DefenderCriteria.LAPLACE_REASON else 1
+        positive = weights[weights > 0]
+        if len(positive) == 0:
+            return None
+        constraints.append(LinearConstraint(weights[np.newaxis, :], lb=positive.min()))
+        return scale * weights, constraints, n
+
+    if criteria == DefenderCriteria.SAVAGE_MINIMAX:
+        # z - sum over m of per_technique[m, t] * x_m <= 0 for every t
+        rows = np.hstack([-per_technique.T, np.ones((coverage.n_techniques, 1))])
+        constraints = [LinearConstraint(np.hstack([c.A, np.zeros((1, 1))]), lb=c.lb, ub=c.ub) for c in constraints]
+        constraints.append(LinearConstraint(rows, ub=0))
+        return np.append(weights, -1.0), constraints, n + 1
+
+    raise RuntimeError("Unknown criteria %s!" % criteria)
+
+
+def best_strategies(coverage, costs, criteria, k=3, progress=None):
+    """Up to k best strategies in order, as [(rank, criteria value, mitigation positions)].
+
+    progress(done fraction) is called before every solve, so a raising callback stops the search.
+    """
+    problem = _problem(coverage, costs, criteria)
+    if problem is None:
+        return []
+    objective, constraints, n_vars = problem
+    n = coverage.n_mitigations
+    integrality = np.zeros(n_vars)
+    integrality[:n] = 1
+    lower = np.zeros(n_vars)
+    upper = np.ones(n_vars)
+    if n_vars > n:
+        # z is bounded by the full-attack payoff, which keeps the problem bounded
+        lower[n:], upper[n:] = -np.inf, np.inf
+
+    resolver = CombinationGenerator(range(n))
+    found = []
+    for found_count in range(k):
+        if progress is not None:
+            progress(found_count / k)
+        result = milp(objective, integrality=integrality, bounds=Bounds(lower, upper), constraints=constraints)
+        if result.x is None:
+            break
+        positions = np.flatnonzero(np.round(result.x[:n]) > 0)
+        found.append((resolver.rankVaryingLengthCombination(positions.tolist()), float(result.fun), positions))
+        # No-good cut: sum over chosen of x_m - sum over the rest of x_m <= |chosen| - 1
+        cut = -np.ones(n_vars)
+        cut[positions] = 1
+        cut[n:] = 0
+        constraints = constraints + [LinearConstraint(cut[np.newaxis, :], ub=len(positions) - 1)]
+    return found
@@ -0,0 +1,185 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from stix2 import parse
+
+import profiling
+import stixlib as sx
+from stixgraph import RelationshipGraph
+from stixindex import FilterIndex
+
+# Bump when the on-disk layout changes, old entries are then ignored and rebuilt
+CACHE_FORMAT = 1
+
+# Object types kept in the bundle, everything else from ATT&CK is never queried by the app
+KINDS = ("attack-pattern", "course-of-action", "x-mitre-tactic", "relationship")
+# Types registered in stix2, parse() fills `revoked` with False for them, so filters on raw
+# dicts have to see the same default
+_TYPES_WITH_REVOKED_DEFAULT = ("attack-pattern", "course-of-action", "relationship")
+
+INDEX_DTYPE = np.dtype([("offset", "<i8"), ("length", "<i4"), ("kind", "u1"), ("id", "S64")])
+
+
+def default_cache_dir():
+    return os.environ.get("GTSEC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "gametheorysec"))
+
+
+def is_offline():
+    return os.environ.get("GTSEC_OFFLINE", "").lower() in ("1", "true", "yes")
+
+
+def bundle_dir(domain, version, cache_dir=None):
+    return os.path.join(cache_dir or default_cache_dir(), f"v{CACHE_FORMAT}", domain, version)
+
+
+def filter_bundle(stix_objects):
+    """Keep techniques, mitigations, tactics and the relationships between them."""
+    kept = [o for o in stix_objects if o.get("type") in KINDS[:-1]]
+    kept_ids = {o["id"] for o in kept}
+    for o in stix_objects:
+        if o.get("type") == "relationship" and o.get("source_ref") in kept_ids and o.get("target_ref") in kept_ids:
+            kept.append(o)
+    return kept
+
+
+def save_bundle(stix_objects, domain, version, cache_dir=None):
+    """Write filtered ATT&CK objects into the cache as a blob of JSON objects plus a memory-mappable index.
+
+    Layout of ``<cache_dir>/v<format>/<domain>/<version>/``:
+      objects.bin - compact JSON of every object, concatenated
+      index.npy   - offset, length, kind and STIX id of every object in objects.bin
+      meta.json   - domain, version and object counts
+      filters.json - property value to rows indexes for queries, see stixindex.FilterIndex
+      graph/      - compiled relationships, see stixgraph.RelationshipGraph
+    """
+    path = bundle_dir(domain, version, cache_dir)
+    objects = filter_bundle(stix_objects)
+    index = np.zeros(len(objects), dtype=INDEX_DTYPE)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=f".{version}-", dir=os.path.dirname(path))
+    try:
+        offset = 0
+        with open(os.path.join(tmp_path, "objects.bin"), "wb") as blob:
+            for row, obj in enumerate(objects):
+                if obj["type"] in _TYPES_WITH_REVOKED_DEFAULT:
+                    obj = dict(obj)
+                    obj.setdefault("revoked", False)
+                    objects[row] = obj
+                data = json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+                blob.write(data)
+                index[row] = (offset, len(data), KINDS.index(obj["type"]), obj["id"].encode("ascii"))
+                offset += len(data)
+        np.save(os.path.join(tmp_path, "index.npy"), index)
+        FilterIndex.build(objects).save(os.path.join(tmp_path, "filters.json"))
+        RelationshipGraph.build(objects).save(os.path.join(tmp_path, "graph"))
+        with open(os.path.join(tmp_path, "meta.json"), "w") as meta:
+            json.dump({
+                "format": CACHE_FORMAT,
+                "domain": domain,
+                "version": version,
+                "created": time.time(),
+                "counts": {kind: int((index["kind"] == code).sum()) for code, kind in enumerate(KINDS)},
+            }, meta)
+        # Another process may have finished the same bundle first, both copies are identical then
+        if os.path.isdir(path):
+            shutil.rmtree(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return path
+
+
+class CachedStore:
+    """Read-only, MemoryStore compatible view over a cached bundle.
+
+    Opening maps the index and the blob into memory without decoding anything. Queries are narrowed
+    down by the saved filter indexes, objects are decoded from JSON only when a filter has to be
+    evaluated on them and parsed into stix2 objects only when they are returned, so stixlib helpers
+    work on it unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as meta:
+            self.meta = json.load(meta)
+        self.index = np.load(os.path.join(path, "index.npy"), mmap_mode="r")
+        self._blob = np.memmap(os.path.join(path, "objects.bin"), dtype=np.uint8, mode="r") \
+            if os.path.getsize(os.path.join(path, "objects.bin")) else np.zeros(0, dtype=np.uint8)
+        self._raw = [None] * len(self.index)
+        self._parsed = {}
+        self._rows_by_id = None
+        self._graph = None
+        self._filters = None
+
+    def _decode(self, row):
+        raw = self._raw[row]
+        if raw is None:
+            offset, length = int(self.index["offset"][row]), int(self.index["length"][row])
+            raw = json.loads(self._blob[offset:offset + length].tobytes())
+            self._raw[row] = raw
+        return raw
+
+    def _object(self, row):
+        obj = self._parsed.get(row)
+        if obj is None:
+            obj = parse(self._decode(row), allow_custom=True)
+            self._parsed[row] = obj
+        return obj
+
+    @property
+    def filters(self):
+        if self._filters is None:
+            filters_path = os.path.join(self.path, "filters.json")
+            if not os.path.isfile(filters_path):
+                FilterIndex.build([self._decode(row) for row in range(len(self.index))]).save(filters_path)
+            self._filters = FilterIndex.load(filters_path)
+        return self._filters
+
+    def query(self, query=None):
+        return [self._object(row) for row in self.filters.select(query, self._decode)]
+
+    def id_at(self, row):
+        return self.index["id"][row].decode("ascii")
+
+    def object_at(self, row):
+        return self._object(row)
+
+    @property
+    def graph(self):
+        """Relationship graph of the bundle, compiled on first use and saved next to it."""
+        if self._graph is None:
+            graph_path = os.path.join(self.path, "graph")
+            if not os.path.isfile(os.path.join(graph_path, "types.json")):
+                RelationshipGraph.build([self._decode(row) for row in range(len(self.index))]).save(graph_path)
+            self._graph = RelationshipGraph.load(graph_path)
+        return self._graph
+
+    def get(self, stix_id):
+        if self._rows_by_id is None:
+            self._rows_by_id = {i.decode("ascii"): row for row, i in enumerate(self.index["id"])}
+        row = self._rows_by_id.get(stix_id)
+        return None if row is None else self._object(row)
+
+
+def get_source(domain, version, cache_dir=None, offline=None):
+    """Return the ATT&CK source for domain and version, downloading and caching it on first use.
+
+    In offline mode (argument or GTSEC_OFFLINE=1) the network is never touched and a missing
+    bundle raises FileNotFoundError.
+    """
+    if offline is None:
+        offline = is_offline()
+    path = bundle_dir(domain, version, cache_dir)
+    with profiling.phase("stix_load"):
+        if not os.path.isfile(os.path.join(path, "meta.json")):
+            if offline:
+                raise FileNotFoundError(f"ATT&CK {domain} {version} is not cached in {path} and offline mode is on")
+            save_bundle(sx.get_objects_for_version(domain, version), domain, version, cache_dir)
+        return CachedStore(path)
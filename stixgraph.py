@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+FLAGS_DTYPE = np.dtype([("revoked", "?"), ("deprecated", "?")])
+_ARRAYS = ("fwd_indptr", "fwd_nodes", "fwd_edges", "rev_indptr", "rev_nodes", "rev_edges")
+
+
+def _csr(keys, nodes, edges, n_nodes):
+    order = np.argsort(keys, kind="stable")
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_nodes), out=indptr[1:])
+    return indptr, nodes[order], edges[order]
+
+
+class RelationshipGraph:
+    """Compiled relationships of a bundle: CSR arrays of object rows per relationship type, both directions.
+
+    Objects are identified by their row in the bundle, relationship objects included. For every
+    relationship type fwd_* lists the targets of each source row and rev_* the sources of each
+    target row, *_edges holds the row of the relationship object itself. Revoked and deprecated
+    relationships are left out, like stixlib.get_related does.
+    """
+
+    def __init__(self, flags, adjacency):
+        self.flags = flags
+        self.adjacency = adjacency
+
+    @property
+    def n_nodes(self):
+        return len(self.flags)
+
+    @classmethod
+    def build(cls, objects):
+        """Build from the bundle objects (dicts or stix2 objects) in row order."""
+        flags = np.zeros(len(objects), dtype=FLAGS_DTYPE)
+        row_of = {}
+        for row, obj in enumerate(objects):
+            flags[row] = (obj.get("revoked", False), obj.get("x_mitre_deprecated", False))
+            row_of[obj["id"]] = row
+
+        edges = {}
+        for row, obj in enumerate(objects):
+            if obj["type"] != "relationship" or flags["revoked"][row] or flags["deprecated"][row]:
+                continue
+            source, target = row_of.get(obj["source_ref"]), row_of.get(obj["target_ref"])
+            if source is None or target is None:
+                continue
+            edges.setdefault(obj["relationship_type"], []).append((source, target, row))
+
+        adjacency = {}
+        for rel_type, triples in edges.items():
+            sources, targets, rels = (np.array(column, dtype=np.int64) for column in zip(*triples))
+            fwd = _csr(sources, targets, rels, len(objects))
+            rev = _csr(targets, sources, rels, len(objects))
+            adjacency[rel_type] = dict(zip(_ARRAYS, fwd + rev))
+        return cls(flags, adjacency)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=".graph-", dir=os.path.dirname(path))
+        try:
+            np.save(os.path.join(tmp_path, "flags.npy"), self.flags)
+            for number, (rel_type, arrays) in enumerate(self.adjacency.items()):
+                for name, array in arrays.items():
+                    np.save(os.path.join(tmp_path, f"{number}-{name}.npy"), array)
+            with open(os.path.join(tmp_path, "types.json"), "w") as types:
+                json.dump(list(self.adjacency), types)
+            if os.path.isdir(path):
+                shutil.rmtree(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """Open a saved graph, arrays are memory-mapped."""
+        with open(os.path.join(path, "types.json")) as types:
+            rel_types = json.load(types)
+        adjacency = {rel_type: {name: np.load(os.path.join(path, f"{number}-{name}.npy"), mmap_mode="r")
+                                for name in _ARRAYS}
+                     for number, rel_type in enumerate(rel_types)}
+        return cls(np.load(os.path.join(path, "flags.npy"), mmap_mode="r"), adjacency)
+
+    def neighbours(self, rel_type, row, reverse=False):
+        """(object rows, relationship rows) related to row by rel_type."""
+        arrays = self.adjacency.get(rel_type)
+        if arrays is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        prefix = "rev_" if reverse else "fwd_"
+        lo, hi = arrays[prefix + "indptr"][row], arrays[prefix + "indptr"][row + 1]
+        return arrays[prefix + "nodes"][lo:hi], arrays[prefix + "edges"][lo:hi]
+
+    def adjacent(self, rel_type, reverse=False):
+        """Yield (row, object rows, relationship rows) for every row having rel_type relationships."""
+        arrays = self.adjacency.get(rel_type)
+        if arrays is None:
+            return
+        prefix = "rev_" if reverse else "fwd_"
+        indptr = np.asarray(arrays[prefix + "indptr"])
+        nodes, edges = arrays[prefix + "nodes"], arrays[prefix + "edges"]
+        for row in np.flatnonzero(np.diff(indptr)):
+            lo, hi = indptr[row], indptr[row + 1]
+            yield int(row), nodes[lo:hi], edges[lo:hi]
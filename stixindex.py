@@ -0,0 +1,136 @@
+import json
+import os
+import tempfile
+
+from stix2.datastore.filters import Filter, apply_common_filters
+
+# Properties stixlib filters on, kill chain phases are indexed per field like stix2 evaluates them
+INDEXED_PROPERTIES = (
+    "type",
+    "id",
+    "kill_chain_phases.phase_name",
+    "kill_chain_phases.kill_chain_name",
+    "revoked",
+    "x_mitre_deprecated",
+    "x_mitre_is_subtechnique",
+)
+
+
+def _values(obj, path):
+    """Values a stix2 Filter on path would compare against, e.g. every phase_name of kill_chain_phases."""
+    prop, _, rest = path.partition(".")
+    if prop not in obj:
+        return []
+    value = obj[prop]
+    items = value if isinstance(value, list) else [value]
+    if rest:
+        return [v for item in items for v in _values(item, rest)]
+    return items
+
+
+def normalise_query(query):
+    if query is None:
+        return []
+    # Filter is a namedtuple, so a single one has to be told apart from a list of them
+    if isinstance(query, Filter) or not isinstance(query, (list, tuple, set)):
+        return [query]
+    return list(query)
+
+
+class FilterIndex:
+    """Hash indexes from property values to object rows for the properties stixlib filters on.
+
+    A `Filter` with `=` or `in` on an indexed property is answered by a lookup, the matching rows of
+    all such filters are intersected and only the remaining filters are evaluated, on those rows.
+    An object without the property is in no posting list, which is how stix2 discards it as well.
+    """
+
+    def __init__(self, size, postings):
+        self.size = size
+        self.postings = postings
+
+    @classmethod
+    def build(cls, objects):
+        postings = {prop: {} for prop in INDEXED_PROPERTIES}
+        for row, obj in enumerate(objects):
+            for prop, by_value in postings.items():
+                for value in _values(obj, prop):
+                    rows = by_value.setdefault(value, [])
+                    if not rows or rows[-1] != row:
+                        rows.append(row)
+        return cls(len(objects), postings)
+
+    def save(self, path):
+        """Write as JSON, values are strings and booleans so they are kept as [value, rows] pairs."""
+        fd, tmp_path = tempfile.mkstemp(prefix=".filters-", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w") as out:
+                json.dump({"size": self.size,
+                           "postings": {prop: list(by_value.items()) for prop, by_value in self.postings.items()}}, out)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["size"], {prop: {value: rows for value, rows in pairs}
+                                  for prop, pairs in data["postings"].items()})
+
+    def _lookup(self, f):
+        """Rows matching an indexable filter, None when the filter has to be evaluated."""
+        by_value = self.postings.get(f.property)
+        if by_value is None:
+            return None
+        if f.op == "=":
+            values = [f.value]
+        elif f.op == "in" and isinstance(f.value, (list, tuple, set, frozenset)):
+            values = f.value
+        else:
+            return None
+        rows = set()
+        try:
+            for value in values:
+                rows.update(by_value.get(value, ()))
+        except TypeError:
+            # Unhashable filter value
+            return None
+        return rows
+
+    def select(self, query, object_at):
+        """Rows matching every filter of query in row order, object_at(row) gives what filters are evaluated on."""
+        indexed, rest = [], []
+        for f in normalise_query(query):
+            rows = self._lookup(f)
+            if rows is None:
+                rest.append(f)
+            else:
+                indexed.append(rows)
+        if indexed:
+            indexed.sort(key=len)
+            rows = sorted(row for row in indexed[0] if all(row in other for other in indexed[1:]))
+        else:
+            rows = range(self.size)
+        if not rest:
+            return list(rows)
+        objects = {id(object_at(row)): row for row in rows}
+        return [objects[id(obj)] for obj in apply_common_filters([object_at(row) for row in rows], rest)]
+
+
+class IndexedStore:
+    """Indexed, read-only front of a MemoryStore, see FilterIndex; other attributes go to the store."""
+
+    def __init__(self, source):
+        self.source = source
+        self.objects = source.query()
+        self.index = FilterIndex.build(self.objects)
+
+    def query(self, query=None):
+        return [self.objects[row] for row in self.index.select(query, self.objects.__getitem__)]
+
+    def __getattr__(self, name):
+        if name == "source":
+            raise AttributeError(name)
+        return getattr(self.source, name)
@@ -2,13 +2,72 @@ import requests
 from stix2 import MemoryStore, Filter
 from stix2.v21 import AttackPattern
 
+from stixindex import IndexedStore
+
+# Seconds to connect to GitHub and between two received chunks, a stalled download fails instead of hanging
+DOWNLOAD_TIMEOUT = (10, 60)
+
+
+def _download_json(url, description):
+    try:
+        response = requests.get(url, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            raise RuntimeError(f"ATT&CK {description} does not exist ({url})") from e
+        raise RuntimeError(f"ATT&CK {description} could not be downloaded from {url}: {e}") from e
+    except requests.RequestException as e:
+        raise RuntimeError(f"ATT&CK {description} could not be downloaded from {url}: {e}") from e
+    return response.json()
+
 
 def get_data_from_branch(domain):
     """get the ATT&CK STIX data from MITRE/CTI. Domain should be 'enterprise-attack', 'mobile-attack' or
     'ics-attack'. Branch should typically be master."""
-    stix_json = requests.get(
-        f"https://raw.githubusercontent.com/mitre-attack/attack-stix-data/master/{domain}/{domain}.json").json()
-    return MemoryStore(stix_data=stix_json["objects"])
+    stix_json = _download_json(
+        f"https://raw.githubusercontent.com/mitre-attack/attack-stix-data/master/{domain}/{domain}.json", domain)
+    return IndexedStore(MemoryStore(stix_data=stix_json["objects"]))
+
+
+def get_objects_for_version(domain, version):
+    """get raw ATT&CK STIX objects of a released version (e.g. '14.1') from MITRE/CTI.
+    Version 'latest' fetches the current master bundle. Raises RuntimeError naming the domain and
+    version when the bundle does not exist or cannot be downloaded."""
+    file_name = domain if version == "latest" else f"{domain}-{version}"
+    stix_json = _download_json(
+        f"https://raw.githubusercontent.com/mitre-attack/attack-stix-data/master/{domain}/{file_name}.json",
+        f"{domain} version {version}")
+    return stix_json["objects"]
+
+
+class StixRecord:
+    """Lightweight view of a technique or mitigation used by strategies and simulations.
+    index is the position in the strategy list, the full STIX object is looked up by stix_id."""
+    __slots__ = ("index", "stix_id", "external_id", "name", "url")
+
+    def __init__(self, index, stix_id, external_id, name, url):
+        self.index = index
+        self.stix_id = stix_id
+        self.external_id = external_id
+        self.name = name
+        self.url = url
+
+    def __repr__(self):
+        return f"StixRecord({self.index}, {self.stix_id!r}, {self.external_id!r}, {self.name!r})"
+
+
+def to_record(stix_object, index):
+    external_id, url = "", ""
+    for ref in stix_object.get("external_references", []):
+        if ref.get("source_name") == "mitre-attack":
+            external_id, url = ref.get("external_id", ""), ref.get("url", "")
+            break
+    return StixRecord(index, stix_object.get("id"), external_id, stix_object.get("name"), url)
+
+
+def to_records(stix_objects):
+    """records for a strategy list, index of each record is its position in the list."""
+    return [to_record(stix_object, index) for index, stix_object in enumerate(stix_objects)]
 
 
 def get_techniques_or_subtechniques(thesrc, include="both"):
@@ -95,6 +154,10 @@ def get_related(thesrc, src_type, rel_type, target_type, reverse=False):
          reverse: build reverse mapping of target to source
     """
 
+    # Cached bundles carry a compiled relationship graph, see stixcache.CachedStore.graph
+    if getattr(thesrc, "graph", None) is not None:
+        return _get_related_from_graph(thesrc, src_type, rel_type, target_type, reverse)
+
     relationships = thesrc.query([
         Filter('type', '=', 'relationship'),
         Filter('relationship_type', '=', rel_type),
@@ -167,6 +230,38 @@ def get_related(thesrc, src_type, rel_type, target_type, reverse=False):
     return output
 
 
+def _graph_related_rows(thesrc, src_type, rel_type, target_type, reverse):
+    """Yield (stix_id, [(object row, relationship row)]) in get_related order of keys and values."""
+    graph = thesrc.graph
+    key_type, value_type = (target_type, src_type) if reverse else (src_type, target_type)
+    for row, nodes, edges in graph.adjacent(rel_type, reverse=reverse):
+        stix_id = thesrc.id_at(row)
+        if key_type not in stix_id:
+            continue
+        related = [(int(node), int(edge)) for node, edge in zip(nodes, edges) if value_type in thesrc.id_at(node)]
+        if not related:
+            continue
+        # Revoked targets are skipped, but the key stays like in get_related
+        yield stix_id, [(node, edge) for node, edge in related if not graph.flags["revoked"][node]]
+
+
+def _get_related_from_graph(thesrc, src_type, rel_type, target_type, reverse):
+    return {
+        stix_id: [{"object": thesrc.object_at(node), "relationship": thesrc.object_at(edge)} for node, edge in related]
+        for stix_id, related in _graph_related_rows(thesrc, src_type, rel_type, target_type, reverse)
+    }
+
+
+def get_related_ids(thesrc, src_type, rel_type, target_type, reverse=False):
+    """same mapping as get_related but with STIX ids of related objects only: stix_id => [related_id].
+    Cached bundles answer it from the compiled graph without parsing any STIX object."""
+    if getattr(thesrc, "graph", None) is not None:
+        return {stix_id: [thesrc.id_at(node) for node, _ in related]
+                for stix_id, related in _graph_related_rows(thesrc, src_type, rel_type, target_type, reverse)}
+    return {stix_id: [relation["object"]["id"] for relation in related]
+            for stix_id, related in get_related(thesrc, src_type, rel_type, target_type, reverse).items()}
+
+
 # technique:mitigation
 def mitigation_mitigates_techniques(thesrc):
     """return mitigation_id => {technique, relationship} for each technique mitigated by the mitigation."""
@@ -178,6 +273,11 @@ def technique_mitigated_by_mitigations(thesrc):
     return get_related(thesrc, "course-of-action", "mitigates", "attack-pattern", reverse=True)
 
 
+def mitigation_mitigates_technique_ids(thesrc):
+    """return mitigation_id => [technique_id] for each technique mitigated by the mitigation."""
+    return get_related_ids(thesrc, "course-of-action", "mitigates", "attack-pattern", reverse=False)
+
+
 def is_technique_mitigated_by_mitigations_specified(relations, technique_id, mitigations):
     result = False
     if technique_id in relations.keys():
@@ -1,31 +1,115 @@
-import math
-import operator
-import random
 import time
 
-import intvalpy
-import matplotlib.pyplot as plt
-import plotly.express as px
-import matspy
+# Отсчёт времени запуска текущего прогона скрипта
+_run_started = time.perf_counter()
+
+import dataclasses
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-import pandas as pd
-import scipy as sp
 import streamlit as st
-from intvalpy import Interval
 from humanize.time import precisedelta
 
+import jobs
+import profiling
+import projectfile
+import resultcache
+import stixcache
 import stixlib as sx
 from maths import CombinationGenerator
-from projectsharablestate import ProjectSettings, AppEntry, DefenderCriteria, AttackerCriteria, GameAlgorithm
-
-
-@st.cache_data(persist=True)
-def cached_get_src():
-    thesrc = sx.get_data_from_branch("enterprise-attack")
+from projectsharablestate import (ProjectSettings, AppEntry, DefenderCriteria, AttackerCriteria, GameAlgorithm,
+                                  SamplingMode)
+
+# Библиотеки визуализации (matplotlib, plotly, pandas) и решатели (scipy) импортируются
+# в тех разделах, где они нужны, чтобы первая отрисовка не ждала их загрузки
+
+# Наибольший размер платежной матрицы (ячеек), которая строится целиком для диаграмм
+MATRIX_CELLS_LIMIT = 10_000_000
+# Наибольший размер (ячеек) выборок атак Монте-Карло, которые хранятся для инкрементального пересчёта:
+# на ячейку приходится платеж и битовая маска атаки
+SAMPLES_CELLS_LIMIT = 1_000_000
+# Период опроса фоновой задачи, секунд
+POLL_INTERVAL = 0.5
+
+PROGRESS_TEXT = {
+    GameAlgorithm.MonteCarlo: "Выполняем классический Монте-Карло. Пожалуйста подождите. ",
+    GameAlgorithm.UpperConfidenceBound: "Выполняем Upper-Confidence-Bound. Пожалуйста подождите. ",
+    GameAlgorithm.Analytic: "Выполняем точный расчёт. Пожалуйста подождите. ",
+    GameAlgorithm.Optimization: "Ищем оптимальную стратегию. Пожалуйста подождите. ",
+    GameAlgorithm.DoubleOracle: "Ищем равновесие. Пожалуйста подождите. ",
+    GameAlgorithm.Racing: "Выполняем Монте-Карло с отсевом стратегий. Пожалуйста подождите. ",
+}
+DONE_TEXT = {
+    GameAlgorithm.MonteCarlo: "Метод Монте-Карло занял",
+    GameAlgorithm.UpperConfidenceBound: "Upper-Confidence-Bound занял",
+    GameAlgorithm.Analytic: "Точный расчёт занял",
+    GameAlgorithm.Optimization: "Поиск оптимальной стратегии занял",
+    GameAlgorithm.DoubleOracle: "Поиск равновесия занял",
+    GameAlgorithm.Racing: "Монте-Карло с отсевом стратегий занял",
+}
+
+
+# Результаты запусков общие для всех сессий сервера: недавние в памяти, вытесненные - на диске
+@st.cache_resource
+def result_cache():
+    return resultcache.ResultCache(disk_dir=resultcache.default_results_dir())
+
+
+# Симуляции выполняются фоновыми задачами сервера и переживают перезапуски скрипта,
+# сессия хранит только номер своей задачи
+@st.cache_resource
+def job_runner():
+    return jobs.JobRunner(max_workers=2, keep=16)
+
+
+def restore_reducer(results, criteria, n_simulations, n_columns):
+    from criteria import CriteriaReducer
+
+    reducer = CriteriaReducer(criteria, n_simulations, n_columns, keep_values=False)
+    reducer.values = results.get("values")
+    reducer.best_column = results.get("best_column")
+    for column, value in results["top"]:
+        reducer.top.push(int(column), float(value))
+    return reducer
+
+
+def load_source(domain, version):
+    started = time.perf_counter()
+    thesrc = stixcache.get_source(domain, version)
+    return thesrc, time.perf_counter() - started
+
+
+# Bundle is kept on disk by stixcache, the resource cache keeps one background load per process,
+# so the intro renders while the source is opened or downloaded
+@st.cache_resource
+def source_loader(domain, version):
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="attack-loader").submit(load_source, domain, version)
+
+
+def cached_get_src(domain, version):
+    loader = source_loader(domain, version)
+    waited = time.perf_counter()
+    if loader.exception() is not None:
+        # Неудачная загрузка не должна остаться в кэше
+        source_loader.clear()
+    thesrc, load_seconds = loader.result()
+    startup_timings["Загрузка данных ATT&CK (в фоне)"] = load_seconds
+    startup_timings["Ожидание данных"] = time.perf_counter() - waited
     # st.success("Fetched latest MITRE ATT&CK data")
     return thesrc
 
 
+def mark_startup(phase):
+    startup_timings[phase] = time.perf_counter() - _run_started
+
+
+def show_startup_report():
+    with startup_report:
+        for phase, seconds in startup_timings.items():
+            st.write(f"{phase}: {seconds * 1000:.1f} мс")
+
+
 # @st.cache_data(presist=True)
 def cached_get_technique_to_mitig_relations(thesrc):
     technique_to_mitig_relations = sx.technique_mitigated_by_mitigations(thesrc)
@@ -33,13 +117,8 @@ def cached_get_technique_to_mitig_relations(thesrc):
 
 
 def find_price_for_mitigation(mitigation_id):
-    price_val = 0
-    loss_val = Interval(0, 0)
-    for da in project_settings().defender_apps:
-        if mitigation_id in da.app_mitigations:
-            price_val += da.app_price
-            loss_val += da.app_loss
-    return price_val + loss_val.mid.real
+    # Таблица цен пересобирается только при изменении списка приложений
+    return project_settings().cost_table().price(mitigation_id)
 
 
 def show_result(found_crit, crit_index):
@@ -54,103 +133,118 @@ def show_result(found_crit, crit_index):
 
 
 def get_strategy_for_comb(combin):
-    strategy_data_display = []
-    for mit in combin:
-        name = mit.get("name")
-        url = ""
-        mitre_id = ''
-        for ref in mit.get("external_references"):
-            if ref.get("source_name") == "mitre-attack":
-                url = ref.get("url")
-                mitre_id = ref.get("external_id")
-                break
-        strategy_data_display.append((mitre_id, name, url))
+    import pandas as pd
 
+    # Записи стратегий уже содержат всё, что нужно для отображения
+    strategy_data_display = [(record.external_id, record.name, record.url) for record in combin]
     return pd.DataFrame(strategy_data_display, columns=["mitre_id", "name", "url"])
 
+
+def show_equilibrium(game_equilibrium):
+    st.write(f'''
+                ### Равновесие в смешанных стратегиях
+                Цена игры: $$v =$$ {game_equilibrium.value}
+                ''')
+    col_defender, col_attacker = st.columns(2)
+    with col_defender:
+        "#### Смешанная стратегия администратора"
+        for probability, positions in game_equilibrium.defender:
+            st.write(f"Вероятность {probability:.4f}")
+            st.dataframe(get_strategy_for_comb([defender_strategies[p] for p in positions]))
+    with col_attacker:
+        "#### Смешанная стратегия злоумышленника"
+        for probability, positions in game_equilibrium.attacker:
+            st.write(f"Вероятность {probability:.4f}")
+            st.dataframe(get_strategy_for_comb([attacker_strategies[p] for p in positions]))
+
+
 def get_apps_for_comb(combin):
-    result = []
-    for mitig in combin:
-        for def_app in project_settings().defender_apps:
-            if def_app.is_mitigation_present(mitig.get("id")):
-                if def_app not in result:
-                    result.append(def_app)
-    return result
-
-# mean_x_yi - текущее среднее значение для стратегии y_i
-# n_yi  = уже проведенные симуляции
-def calc_radical_ucb(mean_x_yi, n_yi, n, b):
-    return mean_x_yi - (b * math.sqrt((2 * math.log(n)) / n_yi))
-
-
-def ucb(mitig_max, att_max, simulations_amount, comb_res_m, comb_res_a, b):
-    matrix = np.ndarray((simulations_amount, mitig_max), dtype=np.longlong)
-
-    time_taken = time.time()
-
-    progress_text = "Выполняем Upped-Confidence-Bound. Пожалуйста подождите. "
-    progress_bar = st.progress(0.0, text=progress_text)
-
-    radical_values = np.zeros(mitig_max)
-    already_ran_sim_counts = np.ones(mitig_max, dtype=np.longlong)
-    # Проводим для каждой стратегии M симуляций
-    for j in range(mitig_max):
-        mitig_comb = comb_res_m.unrankVaryingLengthCombination(j)
-        # Проводим по одной симуляции для каждой стратегии
-        # Случайно выбранная стратегия атаки
-        i = random.randrange(0, att_max)
-        attack_comb = comb_res_a.unrankVaryingLengthCombination(i)
-
-        # Проверяем что каждая мера защиты в стратегии защиты защищает от стратегий атаки
-        # Если хотя бы одна из стратегий защищиает current_val > 0
-        for m in mitig_comb:
-            for a in attack_comb:
-                is_mitigated = sx.does_mitigation_mitigates_technique(
-                    relations=m_to_t_relation,
-                    technique_id=a.get("id"),
-                    mitigation_id=m.get("id"))
-                if is_mitigated:
-                    matrix[0, j] += find_price_for_mitigation(m.get("id"))
-
-        current_yi = np.ma.masked_equal(matrix[:, j], 0)
-        current_mean_for_j = np.mean(current_yi)
-        radical_values[j] = calc_radical_ucb(current_mean_for_j, already_ran_sim_counts[j], 1, b)
-        progress_bar.progress(j / mitig_max, text=progress_text)
-
-    for n_yi in range(1, simulations_amount):
-        # Находим для какой стратегии защиты необходимо провести вычисления
-        current_j = radical_values.argmin()
-        # Выбираем случайную стратегию атаки
-        mitig_comb = comb_res_m.unrankVaryingLengthCombination(current_j)
-        i = random.randrange(0, att_max)
-        attack_comb = comb_res_a.unrankVaryingLengthCombination(i)
-        for m in mitig_comb:
-            for a in attack_comb:
-                is_mitigated = sx.does_mitigation_mitigates_technique(
-                    relations=m_to_t_relation,
-                    technique_id=a.get("id"),
-                    mitigation_id=m.get("id"))
-                if is_mitigated:
-                    matrix[n_yi, current_j] += find_price_for_mitigation(m.get("id"))
-        # Отмечаем что для данной стратегии проведена симуляция
-        already_ran_sim_counts[current_j] += 1
-        # Обновляем значение радикала с учетом подсчитанных данных
-        for j in range(mitig_max):
-            current_yi = np.ma.masked_equal(matrix[:, j], 0)
-            current_mean_for_j = np.mean(current_yi)
-            radical_values[j] = calc_radical_ucb(current_mean_for_j, already_ran_sim_counts[j], n_yi, b)
-
-        progress_bar.progress(n_yi / simulations_amount,
-                              text=progress_text + f" $$n_y = $$ {n_yi}, для $$j=$$ {current_j} радикал = {radical_values[current_j]}")
-
-    time_taken -= time.time()
-    st.success(f'Upper-Confidence-Bound занял: {precisedelta(time_taken, minimum_unit="microseconds")}')
-    st.balloons()
-    progress_bar.empty()
-    return matrix
+    return project_settings().cost_table().apps_for([mitig.stix_id for mitig in combin])
+
+
+def simulation_job(job, profile, game, criteria, algorithm, n_simulations, b, seed, workers, keep_values,
+                   keep_matrix, keep_samples, samples, options):
+    # Выполняется в фоновом потоке: без вызовов st, прогресс и промежуточный результат хранятся в задаче,
+    # замеры - в профиле запуска
+    from game import solve_game
+
+    with profile.activate():
+        return solve_game(game, criteria, algorithm, n_simulations=n_simulations, b=b, seed=seed, workers=workers,
+                          keep_values=keep_values, keep_matrix=keep_matrix, keep_samples=keep_samples,
+                          samples=samples, progress=job.report,
+                          partial=lambda reducer: job.publish(reducer.best), **options)
+
+
+def show_profile_report(profile):
+    import pandas as pd
+
+    report = profile.to_dict()
+    with profile_report:
+        phases = [(name, phase["seconds"], phase["calls"]) for name, phase in report["phases"].items()]
+        st.dataframe(pd.DataFrame(phases, columns=["Этап", "Секунды", "Вызовы"]), hide_index=True)
+        for name, value in {**report["counters"], **report["peaks"]}.items():
+            st.write(f"{name}: {value:,}")
+        for name, value in report["rates"].items():
+            st.write(f"{name}: {value:,.0f}")
+        st.download_button("Скачать профиль (JSON)", data=profile.to_json(indent=2, ensure_ascii=False),
+                           file_name="profile.json", mime="application/json")
+        if report["cprofile"]:
+            st.code(report["cprofile"])
+
+
+def record_rendering(profile, seconds):
+    # Отрисовка записывается в профиль один раз за запуск: последующие перезапуски скрипта
+    # (нажатия кнопок, раскрытие блоков) профиль не меняют
+    if st.session_state.get("profile_rendered") is not profile:
+        st.session_state["profile_rendered"] = profile
+        profile.add_phase("rendering", seconds)
+
+
+def store_results(results, meta):
+    # Результаты последнего запуска попадают в файл проекта
+    st.session_state["stored_results"] = results
+    st.session_state["stored_results_meta"] = meta
+
+
+def show_project_download():
+    results = st.session_state.get("stored_results")
+    meta = st.session_state.get("stored_results_meta")
+    key = (str(project_settings().to_dict()), id(results))
+    cached = st.session_state.get("project_file_cache")
+    if cached is None or cached[0] != key:
+        cached = (key, projectfile.project_bytes(project_settings(), results, meta))
+        st.session_state["project_file_cache"] = cached
+    project_file_slot.download_button("Сохранить проект", data=cached[1], file_name="project.gts",
+                                      mime="application/zip",
+                                      help="Настройки проекта и результаты последнего запуска")
+
+
+def show_stored_results(results, meta, defender_strategies):
+    import pandas as pd
+    import plotly.express as px
+
+    st.write("## Сохранённые результаты")
+    st.write(f"Алгоритм: {meta.get('algorithm')}, критерий: {meta.get('criteria')}, "
+             f"симуляций: {meta.get('simulations')}")
+    if meta.get("defender_strategies") != [record.stix_id for record in defender_strategies]:
+        st.warning("Меры защиты проекта изменились после расчёта, номера стратегий ниже относятся к старому набору")
+        return
+    resolver = CombinationGenerator(defender_strategies)
+    if "top" in results:
+        top = results["top"]
+        columns = st.columns(3)
+        for col, (rank, value) in zip(columns, zip(top["column"], top["value"])):
+            col.write(f"j = {rank} W = {value}")
+            col.dataframe(get_strategy_for_comb(resolver.unrankVaryingLengthCombination(int(rank))))
+    if "values" in results:
+        values = results["values"]
+        '#### Значения критерия для каждой стратегии защиты'
+        st.plotly_chart(px.line(y=np.ma.filled(values.astype(float), np.nan), x=range(len(values))))
 
 
 def show_heatmap_for_matrix(mat):
+    import matplotlib.pyplot as plt
+
     mat_heat_fig = plt.figure()
     plt.imshow(mat, cmap='hot', interpolation='bilinear')
     st.pyplot(mat_heat_fig)
@@ -172,6 +266,14 @@ def ready_to_run_sim():
     st.session_state["sim_amount"] = st.session_state.form_sim_amount
     st.session_state["algorithm"] = st.session_state.form_algorithm
     st.session_state["b"] = st.session_state.form_b
+    st.session_state["workers"] = st.session_state.form_workers
+    # 0 - случайное зерно, такие запуски не кэшируются
+    st.session_state["seed"] = st.session_state.form_seed or None
+    st.session_state["confidence"] = st.session_state.form_confidence
+    st.session_state["sampling"] = st.session_state.form_sampling
+    st.session_state["certified_top"] = st.session_state.form_certified_top
+    # Каждое нажатие "Запустить" - новый запуск, фоновая задача ищется по его номеру
+    st.session_state["sim_run"] = st.session_state.get("sim_run", 0) + 1
     st.session_state["ready_to_sim"] = True
 
 
@@ -181,16 +283,24 @@ def save_attacker_settings():
 
 
 def add_app_entry():
-    if not hasattr(project_settings(), 'defender_apps'):
-        st.session_state["project_settings"].defender_apps = []
-    st.session_state["project_settings"].defender_apps.append(AppEntry(app_name=st.session_state.form_app_name,
-                                                                       app_price=st.session_state.form_app_price,
-                                                                       app_loss=Interval(
-                                                                           st.session_state.form_app_loss[0],
-                                                                           st.session_state.form_app_loss[1]),
-                                                                       app_mitigations=[m.get("id") for m in
-                                                                                        st.session_state.form_app_mitig]
-                                                                       ))
+    from intvalpy import Interval
+
+    project_settings().add_app_entry(AppEntry(app_name=st.session_state.form_app_name,
+                                              app_price=st.session_state.form_app_price,
+                                              app_loss=Interval(
+                                                  st.session_state.form_app_loss[0],
+                                                  st.session_state.form_app_loss[1]),
+                                              app_mitigations=[m.get("id") for m in
+                                                               st.session_state.form_app_mitig]
+                                              ))
+
+
+def edit_app_price():
+    # Замена записи увеличивает ревизию проекта: таблица цен строится заново, а следующий запуск
+    # Монте-Карло пересчитывает только стратегии с мерами защиты этого приложения
+    index = st.session_state.form_edit_app
+    entry = project_settings().defender_apps[index]
+    project_settings().replace_app_entry(index, dataclasses.replace(entry, app_price=st.session_state.form_edit_price))
 
 
 def project_settings() -> ProjectSettings:
@@ -199,7 +309,15 @@ def project_settings() -> ProjectSettings:
 
 st.set_page_config(page_title="Game Theory Security", page_icon='🧮', layout="wide")
 
-src = cached_get_src()
+# Время этапов текущего прогона, показывается в боковой панели
+startup_timings = {}
+mark_startup("Импорт модулей")
+startup_report = st.sidebar.expander("Время запуска")
+# Замеры этапов последнего запуска симуляции
+profile_report = st.sidebar.expander("Профилирование")
+profile_report.checkbox("Захват cProfile", key="profile_cprofile",
+                        help="Статистика cProfile по функциям, замедляет расчёт. Применяется к следующему запуску")
+project_file_slot = st.sidebar.container()
 
 if "intro" not in st.session_state:
     st.session_state["intro"] = False
@@ -208,11 +326,15 @@ if "intro" not in st.session_state:
 
 if "newproject" not in st.session_state:
     st.session_state["newproject"] = True
-    new_project = ProjectSettings
-    new_project.mitre_domain = "enterprise-attack"
-    new_project.mitre_version = "14.1"
-    new_project.defender_criteria = DefenderCriteria.LAPLACE_REASON
-    st.session_state["project_settings"] = ProjectSettings
+    new_project = ProjectSettings(mitre_domain="enterprise-attack",
+                                  mitre_version="14.1",
+                                  attacker_max_interval=1000,
+                                  attacker_criteria=None,
+                                  defender_criteria=DefenderCriteria.LAPLACE_REASON)
+    st.session_state["project_settings"] = new_project
+
+# Загрузка источника начинается до отрисовки вступления, результат ожидается, когда он нужен
+source_loader(project_settings().mitre_domain, project_settings().mitre_version)
 
 col1, col2 = st.columns([2, 1])
 
@@ -239,11 +361,29 @@ if st.button("Новый проект", key='start_') and not st.session_state['
 
 uploaded_file = st.file_uploader("Выберите файл проекта", accept_multiple_files=False)
 if uploaded_file is not None:
+    # Файл разбирается один раз, иначе каждый прогон сбрасывал бы изменения проекта.
+    # Массивы результатов не копируются и читаются из загруженных байтов при обращении
+    if st.session_state.get("loaded_file") != (uploaded_file.name, uploaded_file.size):
+        bytes_data = uploaded_file.getvalue()
+        loaded_project = projectfile.load_project(bytes_data)
+        st.session_state["project_settings"] = loaded_project.settings
+        store_results(loaded_project.results, loaded_project.results.meta if loaded_project.results else None)
+        st.session_state["loaded_file"] = (uploaded_file.name, uploaded_file.size)
+        st.session_state["ready_to_sim"] = False
     st.session_state['intro'] = True
     st.session_state['newproject'] = False
-    bytes_data = uploaded_file.getvalue()
+
+mark_startup("Первая отрисовка")
+
+if not st.session_state['intro']:
+    show_startup_report()
 
 if st.session_state['intro']:
+    import pandas as pd
+
+    src = cached_get_src(project_settings().mitre_domain, project_settings().mitre_version)
+    mark_startup("Данные готовы")
+    show_startup_report()
     tactics = sx.get_tactics(src)
 
     st.write("---")
@@ -349,6 +489,19 @@ if st.session_state['intro']:
             st.write("#### Текущий список приложений")
             defender_apps_df = pd.DataFrame([da.as_dict() for da in project_settings().defender_apps])
             st.dataframe(defender_apps_df)
+            with st.form("admin-app-price"):
+                edited_app = st.selectbox(
+                    label="Приложение",
+                    options=range(len(project_settings().defender_apps)),
+                    format_func=lambda i: project_settings().defender_apps[i].app_name,
+                    key="form_edit_app"
+                )
+                edited_price = st.number_input(
+                    label="Новая цена приложения",
+                    key="form_edit_price",
+                    help="в у.е."
+                )
+                submit = st.form_submit_button("Изменить цену", on_click=edit_app_price)
 
         st.write('---')
         st.write("## Настройки Задачи")
@@ -400,7 +553,7 @@ if st.session_state['intro']:
                         key="form_algorithm",
                         placeholder="Выберете алгоритм",
                         format_func=lambda c: c.value[0],
-                        disabled=(project_settings().defender_criteria != DefenderCriteria.LAPLACE_REASON)
+                        disabled=False
                     )
                     b = st.number_input(
                         label="КСС",
@@ -410,27 +563,85 @@ if st.session_state['intro']:
                         disabled=(project_settings().defender_criteria != DefenderCriteria.LAPLACE_REASON),
                         key="form_b"
                     )
+                    workers = st.number_input(
+                        label="Процессы",
+                        help="Число процессов для Монте-Карло, при значении больше 1 стратегии делятся между "
+                             "процессами, а диаграмма значений не строится",
+                        step=1,
+                        min_value=1,
+                        max_value=os.cpu_count() or 1,
+                        value=1,
+                        key="form_workers"
+                    )
+                    seed = st.number_input(
+                        label="Зерно генератора",
+                        help="0 - случайное зерно: каждый запуск Монте-Карло и UCB выполняется заново. "
+                             "Одинаковое ненулевое зерно даёт одинаковые результаты, повторные запуски берутся "
+                             "из кэша, после изменения приложений пересчитываются только затронутые стратегии",
+                        step=1,
+                        min_value=0,
+                        value=0,
+                        key="form_seed"
+                    )
+                    sampling = st.selectbox(
+                        label="Выборка атак",
+                        help="Монте-Карло: общие атаки для всех стратегий считаются за одно матричное произведение "
+                             "и делают сравнение стратегий точнее при том же числе симуляций. Для выборки Соболя "
+                             "лучше брать число симуляций, равное степени двойки",
+                        options=[s for s in SamplingMode],
+                        index=0,
+                        key="form_sampling",
+                        format_func=lambda s: s.value[0],
+                    )
+                    confidence = st.number_input(
+                        label="Доверительная вероятность",
+                        help="Racing: с этой вероятностью найденные лучшие стратегии действительно лучшие",
+                        min_value=0.5,
+                        max_value=0.999,
+                        step=0.01,
+                        value=0.95,
+                        key="form_confidence"
+                    )
+                    certified_top = st.number_input(
+                        label="Число гарантированных лучших стратегий",
+                        help="Racing: отсев продолжается, пока не останется столько стратегий",
+                        step=1,
+                        min_value=1,
+                        max_value=3,
+                        value=1,
+                        key="form_certified_top"
+                    )
                     submit_sim = st.form_submit_button("Запустить", on_click=ready_to_run_sim)
 
+        if st.session_state.get("stored_results") is not None and not st.session_state["ready_to_sim"]:
+            from game import build_game
+
+            show_stored_results(st.session_state["stored_results"], st.session_state["stored_results_meta"],
+                                build_game(src, project_settings()).defender_strategies)
+
         if st.session_state["ready_to_sim"]:
+            from game import build_game
+
             st.write("# Симуляция")
 
             # 1. Составим список стратегий злоумышленника для каждой тактики.
             # Это все возможные уникальные комбинации техник для каждой тактики (по сути сочетание)
 
-            tactics = sx.get_tactics_by_ids(src, tactics_ids=project_settings().attacker_tactics)
-
-            attacker_strategies = list()
-            for tactic in tactics:
-                attacker_strategies += sx.get_techniques_by_tactics(src, tactics=[tactic.get("x_mitre_shortname")])
-            # Sort lexicographically
-            attacker_strategies.sort(key=operator.attrgetter("id"), reverse=True)
-
-            defender_strategies = list()
-            for app in project_settings().defender_apps:
-                defender_strategies += sx.get_mitigations_by_ids(src, migitation_ids=app.app_mitigations)
-            # Sort lexicographically
-            defender_strategies.sort(key=operator.attrgetter("id"), reverse=True)
+            # Стратегии - лёгкие записи, отсортированные по STIX id, индекс записи - её позиция в списке.
+            # Покрытие техник мерами защиты и цены мер строятся по тем же позициям
+            # Игра строится один раз на запуск, а не при каждом опросе фоновой задачи
+            sim_run = st.session_state.get("sim_run", 0)
+            if st.session_state.get("sim_game", (None,))[0] != sim_run:
+                sim_profile = profiling.Profile(cprofile=st.session_state.get("profile_cprofile", False))
+                if "Загрузка данных ATT&CK (в фоне)" in startup_timings:
+                    sim_profile.add_phase("stix_load", startup_timings["Загрузка данных ATT&CK (в фоне)"])
+                with sim_profile.activate():
+                    st.session_state["sim_game"] = (sim_run, build_game(src, project_settings()), sim_profile)
+            game, sim_profile = st.session_state["sim_game"][1:]
+            attacker_strategies = game.attacker_strategies
+            defender_strategies = game.defender_strategies
+            coverage = game.coverage
+            mitigation_costs = game.costs
 
             # Комбинаторная система чисел,
             # позволяет получать нужную комбинацию от её лексографического положения
@@ -456,59 +667,138 @@ if st.session_state['intro']:
             # Количество симуляций
             N = st.session_state.sim_amount
 
-            # STIRX маппинг отношений меры защиты в техники
-            m_to_t_relation = sx.mitigation_mitigates_techniques(src)
-
-            # Разряженная матрица значений
-
-            # matrix_defender = sp.sparse.lil_matrix((N, M_for_defender), dtype=np.longlong)
-            # chosen_def_crit = st.session_state.defender_criteria
-
-            matrix_defender = np.zeros((N, M_for_defender))
-            if "algorithm" in st.session_state and st.session_state["algorithm"] == GameAlgorithm.MonteCarlo:
-                # matrix_defender = np.ndarray((N, M_for_defender), dtype=np.longlong)
-
-                time_taken = time.time()
-
-                progress_text = "Выполняем классический Монте-Карло. Пожалуйста подождите. "
-                progress_bar = st.progress(0.0, text=progress_text)
-
-                # Проводим для каждой стратегии N симуляций
-                for j in range(M_for_defender):
-                    # Комбинация дле текущей стратегии защиты
-                    mitig_comb = combination_resolver_mitigations.unrankVaryingLengthCombination(j)
-
-                    # Проводим N симуляций для текущей стратегии
-                    for n in range(N):
-                        # Случайно выбранная стратегия атаки
-                        i = random.randrange(0, M_for_attacker)
-                        attack_comb = combination_resolver_attacks.unrankVaryingLengthCombination(i)
-
-                        # Проверяем что каждая мера защиты в стратегии защиты защищает от стратегий атаки
-                        # Если хотя бы одна из стратегий защищиает current_val > 0
-                        for m in mitig_comb:
-                            for a in attack_comb:
-                                is_mitigated = sx.does_mitigation_mitigates_technique(
-                                    relations=m_to_t_relation,
-                                    technique_id=a.get("id"),
-                                    mitigation_id=m.get("id"))
-                                if is_mitigated:
-                                    matrix_defender[n, j] += find_price_for_mitigation(m.get("id"))
-                        progress_bar.progress(j / M_for_defender, text=progress_text)
-                        # f"{n} / {simulations_amount} симуляция для $$j = $$ {j}"
-
-                time_taken -= time.time()
-                st.success(f'Метод Монте-Карло занял: {precisedelta(time_taken, minimum_unit="microseconds")}')
-                st.balloons()
-                progress_bar.empty()
-            elif st.session_state["algorithm"] == GameAlgorithm.UpperConfidenceBound:
-                matrix_defender = ucb(M_for_defender, M_for_attacker, N,
-                                      combination_resolver_mitigations,
-                                      combination_resolver_attacks,
-                                      st.session_state.b)
-
-            # matrix_defender = matrix_defender.tocsr()
-
+            # Платежная матрица целиком строится только для диаграмм, если она небольшая,
+            # критерии считаются потоково по блокам столбцов
+            keep_matrix = N * M_for_defender <= MATRIX_CELLS_LIMIT
+            # Выборки атак хранятся только там, где их можно переиспользовать: последовательный
+            # Монте-Карло с независимыми атаками и небольшая матрица
+            keep_samples = (st.session_state["algorithm"] == GameAlgorithm.MonteCarlo
+                            and st.session_state.workers <= 1
+                            and st.session_state.sampling == SamplingMode.Independent
+                            and N * M_for_defender <= SAMPLES_CELLS_LIMIT)
+
+            matrix_defender = None
+            # Параметры отдельных алгоритмов, они же входят в ключ кэша
+            run_options = {}
+            if st.session_state["algorithm"] == GameAlgorithm.Racing:
+                # Доверительные интервалы строятся для среднего, то есть только для критерия Лапласа
+                if project_settings().defender_criteria != DefenderCriteria.LAPLACE_REASON:
+                    st.error("Racing поддерживает только критерий Лапласа")
+                    show_project_download()
+                    st.stop()
+                run_options = {"confidence": st.session_state.confidence,
+                               "certified_top": st.session_state.certified_top}
+            elif (st.session_state["algorithm"] == GameAlgorithm.MonteCarlo
+                  and st.session_state.sampling != SamplingMode.Independent):
+                # Общие атаки для всех стратегий, потоковое распределение по процессам не используется
+                run_options = {"sampling": st.session_state.sampling}
+            # Повтор запуска с теми же входными данными берётся из кэша результатов
+            cache_key = resultcache.result_key(
+                project_settings(), st.session_state["algorithm"], N, st.session_state.b, st.session_state.seed,
+                {name: getattr(value, "name", value) for name, value in run_options.items()})
+            job = None
+            if st.session_state.get("sim_job_run") == sim_run:
+                job = job_runner().get(st.session_state.get("sim_job"))
+            cached_results = result_cache().get(cache_key) if job is None else None
+            if cached_results is not None:
+                results, results_meta = cached_results
+                reducer = restore_reducer(results, project_settings().defender_criteria, N, M_for_defender)
+                matrix_defender = results.get("matrix")
+                st.success("Результат взят из кэша, симуляция не выполнялась")
+            else:
+                if job is None:
+                    # Прошлая задача сессии больше не нужна, вместе с ней отпускается и её результат
+                    job_runner().discard(st.session_state.get("sim_job"))
+                    st.session_state.pop("sim_result", None)
+                    # Выборки атак прошлого запуска Монте-Карло сохраняются: после изменения приложений
+                    # или цен пересчитываются только затронутые стратегии. Без изменений проекта
+                    # запуск выполняется заново, иначе случайное зерно давало бы тот же результат
+                    samples, samples_revision = st.session_state.get("mc_samples", (None, None))
+                    if samples_revision == project_settings().revision:
+                        samples = None
+                    job = job_runner().submit(
+                        simulation_job, sim_profile, game, project_settings().defender_criteria,
+                        st.session_state["algorithm"], N, st.session_state.b, st.session_state.seed,
+                        st.session_state.workers, M_for_defender <= MATRIX_CELLS_LIMIT, keep_matrix,
+                        keep_samples, samples, run_options, key=cache_key)
+                    st.session_state["sim_job"] = job.id
+                    st.session_state["sim_job_run"] = sim_run
+
+                if not job.finished:
+                    # Задача только сохраняет прогресс, отрисовка - при опросе, несколько раз в секунду
+                    st.progress(job.progress, text=PROGRESS_TEXT[st.session_state["algorithm"]])
+                    if job.partial is not None:
+                        st.write(f"Лучшая стратегия на данный момент: j = {job.partial[0]} W = {job.partial[1]}")
+                    st.button("Отменить", on_click=job.cancel)
+                    show_project_download()
+                    time.sleep(POLL_INTERVAL)
+                    st.rerun()
+                if job.status == jobs.CANCELLED:
+                    st.warning("Симуляция отменена")
+                    show_project_download()
+                    st.stop()
+                if job.status == jobs.FAILED:
+                    st.error(f"Симуляция завершилась с ошибкой: {job.error}")
+                    show_project_download()
+                    st.stop()
+
+                # Результат забирается из задачи один раз и дальше хранится только в сессии
+                if st.session_state.get("sim_result", (None,))[0] != job.id:
+                    st.session_state["sim_result"] = (job.id, job.take_result())
+                game_result = st.session_state["sim_result"][1]
+                st.success(f'{DONE_TEXT[st.session_state["algorithm"]]}: '
+                           f'{precisedelta(game_result.seconds, minimum_unit="microseconds")}')
+                if game_result.equilibrium is not None:
+                    rendering_started = time.perf_counter()
+                    st.write(f"Итераций: {game_result.equilibrium.iterations}")
+                    show_equilibrium(game_result.equilibrium)
+                    record_rendering(sim_profile, time.perf_counter() - rendering_started)
+                    show_profile_report(sim_profile)
+                    store_results(None, None)
+                    show_project_download()
+                    # Критерии администратора для смешанных стратегий не считаются
+                    st.stop()
+                if game_result.counts is not None:
+                    st.info(f"Инкрементальный пересчёт: переиспользовано стратегий {game_result.counts['reused']}, "
+                            f"скорректировано {game_result.counts['corrected']}, "
+                            f"новых {game_result.counts['sampled']}")
+                if game_result.racing is not None:
+                    racing_stats = game_result.racing
+                    st.info(f"Racing: {racing_stats.simulations} симуляций вместо {N * M_for_defender} у Монте-Карло, "
+                            f"раундов {racing_stats.rounds}, осталось стратегий {racing_stats.survivors}")
+                    if not racing_stats.certified:
+                        st.warning(f"Лучшие стратегии не разделены за {N} симуляций на стратегию: их значения "
+                                   f"слишком близки, увеличьте число симуляций или снизьте доверительную вероятность")
+                reducer = game_result.reducer
+                matrix_defender = game_result.matrix
+
+                # Результат задачи сохраняется один раз, а не при каждом перезапуске скрипта
+                if st.session_state.get("sim_job_stored") != job.id:
+                    st.session_state["sim_job_stored"] = job.id
+                    if game_result.samples is not None:
+                        st.session_state["mc_samples"] = (game_result.samples, project_settings().revision)
+                    results = {
+                        "values": reducer.values,
+                        "top": np.array(reducer.top.items(), dtype=[("column", np.int64), ("value", np.float64)]),
+                        "best_column": reducer.best_column,
+                        "matrix": matrix_defender,
+                    }
+                    results_meta = {
+                        "algorithm": st.session_state["algorithm"].name,
+                        "criteria": project_settings().defender_criteria.name,
+                        "simulations": N,
+                        "seed": st.session_state.seed,
+                        "defender_strategies": [record.stix_id for record in defender_strategies],
+                    }
+                    # Инкрементальный результат отличается от полного запуска с тем же зерном, в кэш он не попадает
+                    if game_result.counts is None:
+                        result_cache().put(cache_key, results, results_meta, project_settings())
+                    store_results(results, results_meta)
+                results = st.session_state["stored_results"]
+                results_meta = st.session_state["stored_results_meta"]
+            store_results(results, results_meta)
+
+            rendering_started = time.perf_counter()
             st.write("### Диаграмма значений")
             col10, col11 = st.columns(2)
 
@@ -523,128 +813,96 @@ if st.session_state['intro']:
                 """
 
             with col11:
-                masked_matrix = np.ma.masked_equal(matrix_defender, 0)
-                fig, ax = plt.subplots()
-                cax = ax.imshow(masked_matrix, cmap='hot', interpolation='nearest')
-                fig.colorbar(cax)
-                st.pyplot(fig)
+                if matrix_defender is not None:
+                    import matplotlib.pyplot as plt
+                    from scipy import sparse
+
+                    # Матрица разреженная и не больше MATRIX_CELLS_LIMIT ячеек: для диаграммы значений
+                    # она разворачивается, нулевые (и не сохранённые) ячейки маскируются и остаются пустыми
+                    dense = matrix_defender.toarray() if sparse.issparse(matrix_defender) else matrix_defender
+                    masked_matrix = np.ma.masked_equal(dense, 0)
+                    fig, ax = plt.subplots()
+                    cax = ax.imshow(masked_matrix, cmap='hot', interpolation='nearest')
+                    fig.colorbar(cax)
+                    st.pyplot(fig)
+                else:
+                    st.info(f"Матрица {N} x {M_for_defender} не строилась: она слишком велика, считалась в "
+                            f"нескольких процессах или не нужна для точного расчёта")
 
             """
             ---
             ### Результаты работы
             """
+            import plotly.express as px
 
             j_index = 0
             found_criteria_val = 0
-            top_three = {}
+            top_three = dict(reducer.top.items())
+            if reducer.best() is not None:
+                j_index, found_criteria_val = reducer.best()
+            # Значения критерия для каждой стратегии защиты
+            j_criteria = reducer.values
             if project_settings().defender_criteria == DefenderCriteria.LAPLACE_REASON:
-                # Найдем сумму для каждого стоблца
-                sum_of_columns = matrix_defender.sum(axis=0).flatten()
-                # Маскируем некорректные значения
-                sum_of_columns = np.ma.masked_equal(sum_of_columns, 0)
-                # Считаем критерий для каждого столбца: по Лапласу это математическое ожидание
-                j_criteria = sum_of_columns * (1 / N)
-                # Поиск критерия для всей матрицы
-                found_criteria_val = np.min(j_criteria)
-                # Индекс стратегии защиты для найденного критерия
-                j_index = np.argmin(j_criteria)
-
-                three_mins = np.argpartition(j_criteria, 3)
-                for top in three_mins:
-                    top_three[top] = j_criteria[top]
-
                 col1_laplace, col2_laplace = st.columns(2)
                 with col1_laplace:
                     show_result(found_criteria_val, j_index)
                 with col2_laplace:
-                    '#### Сведение критерия Лапласа в процессе Монте-Карло'
-                    # Выбранная нами стратегия
-                    found_criteria_vals = matrix_defender[:, j_index]
-                    # Сводим колонку стратегии в 1d массив
-                    found_criteria_vals = found_criteria_vals.flatten()
-                    # Считаем кумулятивную сумму (каждый элемент кумулятивной суммы это сумма всех предыдущих элемнетов)
-                    cumulative_sum = np.cumsum(found_criteria_vals)
-                    # Считаем математическое ожидание для каждой кумулятивной суммы
-                    for j in range(len(cumulative_sum)):
-                        cumulative_sum[j] = cumulative_sum[j] * (1 / (j + 1))
-                    fig_laplace = px.line(y=cumulative_sum, x=range(len(cumulative_sum)))
-                    fig_laplace.update_traces(connectgaps=True)
-                    fig_laplace.update_layout(yaxis={"title": "Значение критерия", "range": [0, None]},
-                                              xaxis={"title":
-                                                         "Итерация Монте-Карло"})
-                    st.plotly_chart(fig_laplace)
-                    # elif st.session_state.algorithm == GameAlgorithm.UpperConfidenceBound:
+                    if reducer.best_column is not None:
+                        '#### Сведение критерия Лапласа в процессе Монте-Карло'
+                        # Симуляции выбранной нами стратегии
+                        found_criteria_vals = reducer.best_column
+                        # Считаем кумулятивную сумму (каждый элемент кумулятивной суммы это сумма всех предыдущих элемнетов)
+                        cumulative_sum = np.cumsum(found_criteria_vals)
+                        # Считаем математическое ожидание для каждой кумулятивной суммы
+                        cumulative_sum = cumulative_sum / np.arange(1, len(cumulative_sum) + 1)
+                        fig_laplace = px.line(y=cumulative_sum, x=range(len(cumulative_sum)))
+                        fig_laplace.update_traces(connectgaps=True)
+                        fig_laplace.update_layout(yaxis={"title": "Значение критерия", "range": [0, None]},
+                                                  xaxis={"title":
+                                                             "Итерация Монте-Карло"})
+                        st.plotly_chart(fig_laplace)
 
             elif project_settings().defender_criteria == DefenderCriteria.WALD_MAXIMIN:
-                # Найдем максимумы для каждой стратегии
-                maxes_in_j = matrix_defender.max(axis=0).flatten()
-                # Маскируем некорректные значения
-                maxes_in_j = np.ma.masked_equal(maxes_in_j, 0)
-                # Находим критерий для стратегии и индекс
-                found_criteria_val = np.min(maxes_in_j)
-                j_index = np.argmin(maxes_in_j)
-
-                three_mins = np.argpartition(maxes_in_j, 3)
-                for top in three_mins:
-                    top_three[top] = maxes_in_j[top]
-
                 col1_wald, col2_wald = st.columns(2)
                 with col1_wald:
                     show_result(found_criteria_val, j_index)
                 with col2_wald:
-                    '#### Значения критерия для каждой стратегии защиты'
-                    fig_wald = px.line(y=maxes_in_j, x=range(len(maxes_in_j)))
-                    fig_wald.update_traces(connectgaps=True)
-                    st.plotly_chart(fig_wald)
+                    if j_criteria is not None:
+                        '#### Значения критерия для каждой стратегии защиты'
+                        fig_wald = px.line(y=j_criteria, x=range(len(j_criteria)))
+                        fig_wald.update_traces(connectgaps=True)
+                        st.plotly_chart(fig_wald)
 
             elif project_settings().defender_criteria == DefenderCriteria.SAVAGE_MINIMAX:
-                # Для критерия Сэвиджа строится отдельная матрица рисков
-                savage_matrix = np.ndarray((N, M_for_defender))
-
-                mins_in_j = matrix_defender.min(axis=0).flatten()
-                # Маскируем некорректные значения
-                maxes_in_j = np.ma.masked_equal(mins_in_j, 0)
-
-                # Наполняем матрицу рисков
-                for i in range(N):
-                    for j in range(M_for_defender):
-                        savage_matrix[i, j] = matrix_defender[i, j] - mins_in_j[j]
-                # Находим критерий для стратегии и индекс
-                maxes_in_j_savage = savage_matrix.max(axis=0).flatten()
-                maxes_in_j_savage = np.ma.masked_equal(maxes_in_j_savage, np.NaN)
-                found_criteria_val = np.min(maxes_in_j_savage)
-                j_index = np.argmin(maxes_in_j_savage)
-
-                three_mins = np.argpartition(maxes_in_j_savage, 3)
-                for top in three_mins:
-                    top_three[top] = maxes_in_j_savage[top]
-
                 col1_savage, col2_savage = st.columns(2)
                 with col1_savage:
                     show_result(found_criteria_val, j_index)
 
                 with col2_savage:
-                    '#### Матрица рисков'
-                    fig_sav, ax_sav = plt.subplots()
-                    cax_sav = ax_sav.imshow(savage_matrix, cmap='winter', interpolation='nearest')
-                    fig_sav.colorbar(cax_sav)
-                    st.pyplot(fig_sav)
-                    '#### Значения критерия для каждой стратегии защиты'
-                    fig_savage = px.line(y=maxes_in_j_savage, x=range(len(maxes_in_j_savage)))
-                    fig_savage.update_traces(connectgaps=True)
-                    st.plotly_chart(fig_savage)
-
-            if top_three is not None:
+                    if matrix_defender is not None:
+                        '#### Матрица рисков'
+                        # Для критерия Сэвиджа строится отдельная матрица рисков
+                        import matplotlib.pyplot as plt
+
+                        dense_matrix = matrix_defender.toarray()
+                        savage_matrix = dense_matrix - dense_matrix.min(axis=0)
+                        fig_sav, ax_sav = plt.subplots()
+                        cax_sav = ax_sav.imshow(savage_matrix, cmap='winter', interpolation='nearest')
+                        fig_sav.colorbar(cax_sav)
+                        st.pyplot(fig_sav)
+                    if j_criteria is not None:
+                        '#### Значения критерия для каждой стратегии защиты'
+                        fig_savage = px.line(y=j_criteria, x=range(len(j_criteria)))
+                        fig_savage.update_traces(connectgaps=True)
+                        st.plotly_chart(fig_savage)
+
+            if top_three:
                 "Топ 3 стратегий:"
                 columns = st.columns(3)
-                #kth_vals = np.sort(top_three[:3])
-                print(top_three)
                 j_s = list(top_three.keys())
                 j_criterias = list(top_three.values())
-                print(j_s)
-                print(j_criterias)
                 counter = 0
-                for col in columns:
+                for col in columns[:len(j_s)]:
                     col.write(f"Лучшая стратегия топ {counter+1}, j = {j_s[counter]} W ={j_criterias[counter]}")
                     combination = combination_resolver_mitigations.unrankVaryingLengthCombination(j_s[counter])
                     strateg = get_strategy_for_comb(combination)
@@ -662,3 +920,8 @@ if st.session_state['intro']:
                              column_config={
                                  "url": st.column_config.LinkColumn("URL")
                              })
+
+            record_rendering(sim_profile, time.perf_counter() - rendering_started)
+            show_profile_report(sim_profile)
+
+show_project_download()
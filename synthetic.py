@@ -0,0 +1,99 @@
+"""Synthetic ATT&CK bundles of any size, for benchmarks and offline runs.
+
+Bundles hold tactics, techniques (each in one tactic, round robin), mitigations and "mitigates"
+relationships, every (mitigation, technique) pair linked with probability density. Objects carry
+the properties the app reads (kill chain phases, mitre-attack external references, ...), ids and
+contents depend only on the arguments, so a seed reproduces the same bundle.
+
+    python synthetic.py --techniques 200 --mitigations 40 --tactics 10 --version synthetic-200
+
+puts a bundle into the stixcache cache under the given version, usable by the app and batch.py
+with GTSEC_OFFLINE=1.
+"""
+import argparse
+import random
+import uuid
+
+from projectsharablestate import DefenderCriteria, ProjectSettings
+
+DOMAIN = "enterprise-attack"
+TIMESTAMP = "2024-01-01T00:00:00.000Z"
+
+
+def _reference(external_id, kind):
+    return [{"source_name": "mitre-attack", "external_id": external_id,
+             "url": f"https://attack.mitre.org/{kind}/{external_id}"}]
+
+
+def generate_bundle(n_techniques, n_mitigations, n_tactics, density, seed=0):
+    """List of STIX objects (dicts) of a synthetic bundle."""
+    rng = random.Random(seed)
+
+    def new_id(kind):
+        return f"{kind}--{uuid.UUID(int=rng.getrandbits(128), version=4)}"
+
+    def stix_object(kind, **properties):
+        return dict(type=kind, spec_version="2.1", id=new_id(kind), created=TIMESTAMP, modified=TIMESTAMP,
+                    **properties)
+
+    tactics = [stix_object("x-mitre-tactic", name=f"Tactic {i}", x_mitre_shortname=f"tactic-{i}",
+                           external_references=_reference(f"TA{i:04d}", "tactics"))
+               for i in range(n_tactics)]
+    techniques = [stix_object("attack-pattern", name=f"Technique {i}", x_mitre_is_subtechnique=False,
+                              kill_chain_phases=[{"kill_chain_name": "mitre-attack",
+                                                  "phase_name": tactics[i % n_tactics]["x_mitre_shortname"]}],
+                              external_references=_reference(f"T{1000 + i}", "techniques"))
+                  for i in range(n_techniques)]
+    mitigations = [stix_object("course-of-action", name=f"Mitigation {i}",
+                               external_references=_reference(f"M{1000 + i}", "mitigations"))
+                   for i in range(n_mitigations)]
+    relationships = [stix_object("relationship", relationship_type="mitigates", source_ref=mitigation["id"],
+                                 target_ref=technique["id"])
+                     for mitigation in mitigations for technique in techniques if rng.random() < density]
+    return tactics + techniques + mitigations + relationships
+
+
+def project_settings(stix_objects, version, n_tactics=None, n_mitigations=None,
+                     criteria=DefenderCriteria.LAPLACE_REASON, seed=0):
+    """Project over the first n_tactics tactics and n_mitigations mitigations of a bundle.
+
+    Every mitigation is its own app with a price from 1 to 9, so strategies have different costs.
+    """
+    rng = random.Random(seed)
+    tactics = [o["id"] for o in stix_objects if o["type"] == "x-mitre-tactic"][:n_tactics]
+    mitigations = [o["id"] for o in stix_objects if o["type"] == "course-of-action"][:n_mitigations]
+    return ProjectSettings.from_dict({
+        "mitre_domain": DOMAIN,
+        "mitre_version": version,
+        "defender_criteria": criteria.name,
+        "attacker_tactics": tactics,
+        "defender_apps": [{"app_name": f"App {i}", "app_price": rng.randint(1, 9), "app_loss": [0, 1],
+                           "app_mitigations": [mitigation]} for i, mitigation in enumerate(mitigations)],
+    })
+
+
+def cache_bundle(stix_objects, version, cache_dir=None):
+    """Store the bundle in the stixcache cache, returns its directory."""
+    import stixcache
+
+    stixcache.save_bundle(stix_objects, DOMAIN, version, cache_dir)
+    return stixcache.bundle_dir(DOMAIN, version, cache_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic ATT&CK bundle into the local cache.")
+    parser.add_argument("--techniques", type=int, default=200)
+    parser.add_argument("--mitigations", type=int, default=40)
+    parser.add_argument("--tactics", type=int, default=10)
+    parser.add_argument("--density", type=float, default=0.05, help="probability of every mitigates relationship")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--version", default="synthetic", help="ATT&CK version the bundle is cached as")
+    parser.add_argument("--cache-dir", default=None, help="ATT&CK cache directory, see stixcache")
+    args = parser.parse_args(argv)
+
+    objects = generate_bundle(args.techniques, args.mitigations, args.tactics, args.density, args.seed)
+    print(cache_bundle(objects, args.version, args.cache_dir))
+
+
+if __name__ == "__main__":
+    main()
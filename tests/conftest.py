@@ -0,0 +1,30 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coverage import CoverageIndex  # noqa: E402
+from maths import CombinationGenerator  # noqa: E402
+
+
+@pytest.fixture
+def small_game():
+    """(coverage, costs) of 6 mitigations and 10 techniques, small enough to enumerate every attack."""
+    matrix = np.random.default_rng(0).random((6, 10)) < 0.35
+    relations = {f"m{m}": [f"t{t}" for t in np.flatnonzero(row)] for m, row in enumerate(matrix)}
+    coverage = CoverageIndex([f"m{m}" for m in range(6)], [f"t{t}" for t in range(10)], relations)
+    return coverage, np.array([3.0, 1.0, 4.0, 1.5, 5.0, 9.0])
+
+
+@pytest.fixture
+def exact_payoffs(small_game):
+    """Payoff of every strategy (rows, by rank) against every non-empty attack (columns)."""
+    coverage, costs = small_game
+    strategies = CombinationGenerator(range(coverage.n_mitigations)).unrankVaryingLengthBatch(
+        np.arange(2 ** coverage.n_mitigations - 1))
+    attacks = (np.arange(1, 2 ** coverage.n_techniques)[:, np.newaxis] >> np.arange(coverage.n_techniques)) & 1
+    return (strategies * costs) @ coverage.matrix.astype(float) @ attacks.T
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import analytic
+import solver
+from projectsharablestate import DefenderCriteria
+
+
+def brute_force(criteria, exact_payoffs):
+    masked = np.ma.masked_equal(exact_payoffs, 0)
+    if criteria == DefenderCriteria.LAPLACE_REASON:
+        return np.ma.masked_equal(exact_payoffs.sum(axis=1), 0) / exact_payoffs.shape[1]
+    if criteria == DefenderCriteria.WALD_MAXIMIN:
+        return masked.max(axis=1)
+    return np.ma.masked_invalid(exact_payoffs.max(axis=1) - exact_payoffs.min(axis=1))
+
+
+@pytest.mark.parametrize("criteria", list(DefenderCriteria))
+def test_analytic_matches_brute_force(criteria, small_game, exact_payoffs):
+    coverage, costs = small_game
+    expected = brute_force(criteria, exact_payoffs)
+
+    reducer = analytic.analytic_criteria(coverage, costs, criteria)
+
+    assert (np.ma.getmaskarray(reducer.values) == np.ma.getmaskarray(expected)).all()
+    assert np.allclose(reducer.values.compressed(), expected.compressed())
+    assert reducer.best() == (int(expected.argmin()), pytest.approx(float(expected.min())))
+
+
+@pytest.mark.parametrize("criteria", list(DefenderCriteria))
+def test_optimization_finds_brute_force_top(criteria, small_game, exact_payoffs):
+    coverage, costs = small_game
+    expected = brute_force(criteria, exact_payoffs)
+
+    found = solver.best_strategies(coverage, costs, criteria, k=3)
+
+    assert [value for _, value, _ in found] == pytest.approx(np.sort(expected.compressed())[:3].tolist())
+    for rank, value, _ in found:
+        assert expected[rank] == pytest.approx(value)
@@ -0,0 +1,35 @@
+import io
+import json
+
+import batch
+import synthetic
+
+VERSION = "synthetic-batch"
+
+
+def test_bad_lines_fail_alone(tmp_path):
+    objects = synthetic.generate_bundle(20, 4, 2, 0.3, seed=0)
+    synthetic.cache_bundle(objects, VERSION, tmp_path)
+    project = synthetic.project_settings(objects, VERSION).to_dict()
+    projects = tmp_path / "projects.jsonl"
+    projects.write_text("\n".join([
+        json.dumps({"name": "first", "project": project}),
+        "{not json",
+        json.dumps([project]),
+        json.dumps({"name": "last", "project": project}),
+    ]) + "\n", encoding="utf-8")
+
+    output = io.StringIO()
+    failures = batch.run_batch([str(projects)], output, {"algorithm": "Analytic", "simulations": 10, "b": 1000,
+                                                         "seed": 0, "workers": 1}, cache_dir=str(tmp_path),
+                               offline=True)
+
+    results = {result["line"]: result for result in map(json.loads, output.getvalue().splitlines())}
+    assert failures == 2
+    assert sorted(results) == [1, 2, 3, 4]
+    assert "JSONDecodeError" in results[2]["error"]
+    assert "JSON object" in results[3]["error"]
+    for line, name in ((1, "first"), (4, "last")):
+        assert "error" not in results[line]
+        assert results[line]["name"] == name
+        assert results[line]["top"]
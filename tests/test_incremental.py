@@ -0,0 +1,56 @@
+import numpy as np
+
+import simulation
+from coverage import CoverageIndex
+from incremental import SampleStore
+from maths import CombinationGenerator
+
+
+def all_payoffs(coverage, costs, attacks):
+    strategies = simulation.strategy_masks(coverage.n_mitigations, 0, 2 ** coverage.n_mitigations - 1)
+    return simulation.payoff(coverage, costs, strategies, attacks)
+
+
+def test_simulate_matches_monte_carlo(small_game):
+    coverage, costs = small_game
+
+    store = SampleStore.simulate(coverage, costs, 30, seed=4)
+
+    assert (store.payoffs == simulation.monte_carlo(coverage, costs, 30, seed=4)).all()
+
+
+def test_price_change_matches_fresh_simulation(small_game):
+    coverage, costs = small_game
+    store = SampleStore.simulate(coverage, costs, 30, seed=4)
+    changed = costs.copy()
+    changed[2] = 40.0
+
+    updated, counts = store.update(coverage, changed)
+
+    fresh = SampleStore.simulate(coverage, changed, 30, seed=4)
+    assert (updated.attacks == fresh.attacks).all()
+    assert np.allclose(updated.payoffs, fresh.payoffs)
+    # Strategies with mitigation 2 are corrected, the other half is reused as is
+    assert counts == {"reused": 31, "corrected": 32, "sampled": 0}
+    assert store.can_update(coverage, 30, None)
+    assert not store.can_update(coverage, 30, 5)
+
+
+def test_new_mitigation_gets_fresh_samples(small_game):
+    coverage, costs = small_game
+    store = SampleStore.simulate(coverage, costs, 30, seed=4)
+    relations = {m_id: [coverage.technique_ids[t] for t in np.flatnonzero(coverage.matrix[m])]
+                 for m, m_id in enumerate(coverage.mitigation_ids)}
+    relations["m6"] = ["t0", "t1"]
+    grown = CoverageIndex(coverage.mitigation_ids + ["m6"], coverage.technique_ids, relations)
+    grown_costs = np.append(costs, 2.0)
+
+    updated, counts = store.update(grown, grown_costs)
+
+    assert counts == {"reused": 63, "corrected": 0, "sampled": 64}
+    assert np.allclose(updated.payoffs, all_payoffs(grown, grown_costs, updated.attacks))
+    # Old strategies keep their samples under their new ranks
+    old_strategies = simulation.strategy_masks(6, 0, 63)
+    new_ranks = CombinationGenerator(range(7)).rankVaryingLengthBatch(
+        np.hstack([old_strategies, np.zeros((63, 1), dtype=bool)]))
+    assert (updated.payoffs[:, new_ranks] == store.payoffs).all()
@@ -0,0 +1,24 @@
+import numpy as np
+
+from maths import CombinationGenerator, pack_bits, popcount, unpack_bits
+
+
+def test_batch_unrank_and_rank_match_scalar():
+    resolver = CombinationGenerator(range(7))
+    ranks = np.arange(2 ** 7 - 1)
+    masks = resolver.unrankVaryingLengthBatch(ranks)
+
+    for rank, mask in zip(ranks, masks):
+        positions = resolver.unrankVaryingLengthCombination(int(rank))
+        assert np.flatnonzero(mask).tolist() == list(positions)
+        assert resolver.rankVaryingLengthCombination(list(positions)) == rank
+    assert resolver.rankVaryingLengthBatch(masks).tolist() == ranks.tolist()
+
+
+def test_bitsets_round_trip():
+    mask = np.random.default_rng(0).random((5, 130)) < 0.5
+    bits = pack_bits(mask)
+
+    assert bits.shape == (5, 3)
+    assert (unpack_bits(bits, 130) == mask).all()
+    assert popcount(bits).tolist() == mask.sum(axis=1).tolist()
@@ -0,0 +1,68 @@
+import numpy as np
+from scipy import sparse
+
+import projectfile
+import resultcache
+import synthetic
+from projectsharablestate import GameAlgorithm
+
+OBJECTS = synthetic.generate_bundle(20, 5, 3, 0.3, seed=2)
+
+
+def results():
+    return {
+        "values": np.ma.masked_equal([0.0, 1.5, 2.5, 0.0], 0),
+        "top": np.array([(1, 1.5), (2, 2.5)], dtype=[("column", np.int64), ("value", np.float64)]),
+        "matrix": sparse.csc_matrix(np.array([[0.0, 1.0, 0.0, 0.0], [0.0, 2.0, 5.0, 0.0]])),
+        "best_column": None,
+    }
+
+
+def assert_same_results(loaded, expected):
+    assert (np.ma.getmaskarray(loaded["values"]) == np.ma.getmaskarray(expected["values"])).all()
+    assert (loaded["values"].filled(0) == expected["values"].filled(0)).all()
+    assert (loaded["top"] == expected["top"]).all()
+    assert sparse.issparse(loaded["matrix"])
+    assert (loaded["matrix"].toarray() == expected["matrix"].toarray()).all()
+    assert loaded.get("best_column") is None
+
+
+def test_project_round_trip(tmp_path):
+    settings = synthetic.project_settings(OBJECTS, "synthetic")
+    path = str(tmp_path / "project.gts")
+
+    projectfile.save_project(path, settings, results(), {"algorithm": "MonteCarlo"})
+
+    for source in (path, projectfile.project_bytes(settings, results(), {"algorithm": "MonteCarlo"})):
+        loaded = projectfile.load_project(source)
+        assert loaded.settings.to_dict() == settings.to_dict()
+        assert loaded.results.meta == {"algorithm": "MonteCarlo"}
+        assert_same_results(loaded.results, results())
+
+
+def test_settings_only_project(tmp_path):
+    settings = synthetic.project_settings(OBJECTS, "synthetic")
+
+    loaded = projectfile.load_project(projectfile.project_bytes(settings))
+
+    assert loaded.settings.to_dict() == settings.to_dict()
+    assert loaded.results is None
+
+
+def test_result_cache_spills_and_reads_back(tmp_path):
+    settings = synthetic.project_settings(OBJECTS, "synthetic")
+    keys = [resultcache.result_key(settings, GameAlgorithm.MonteCarlo, 10, seed=seed) for seed in (1, 2)]
+    # Room for one entry in memory, the older one goes to disk
+    cache = resultcache.ResultCache(memory_bytes=1, disk_dir=str(tmp_path))
+
+    for key in keys:
+        cache.put(key, results(), {"seed": key}, settings)
+
+    assert len(set(keys)) == 2
+    assert len(list(tmp_path.glob("*.gts"))) == 1
+    assert resultcache.result_key(settings, GameAlgorithm.MonteCarlo, 10, seed=None) is None
+    for key in keys:
+        stored, meta = cache.get(key)
+        assert meta == {"seed": key}
+        assert_same_results(stored, results())
+    assert cache.get("missing") is None
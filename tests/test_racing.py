@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+import racing
+from criteria import CriteriaReducer
+from projectsharablestate import DefenderCriteria
+
+
+@pytest.mark.parametrize("k", [1, 2])
+def test_certified_top_is_the_exact_top(k, small_game, exact_payoffs):
+    coverage, costs = small_game
+    exact = np.ma.masked_equal(exact_payoffs.mean(axis=1), 0)
+    reducer = CriteriaReducer(DefenderCriteria.LAPLACE_REASON, 20000, len(exact), k=3)
+
+    stats = racing.racing(coverage, costs, DefenderCriteria.LAPLACE_REASON, reducer, 20000, k=k, seed=1)
+
+    assert stats.certified
+    assert stats.simulations < 20000 * exact.count()
+    top = [rank for rank, _ in reducer.top.items()]
+    assert len(top) == 3
+    assert sorted(top[:k]) == sorted(np.argsort(exact.filled(np.inf), kind="stable")[:k].tolist())
+
+
+def test_rejects_invalid_arguments(small_game):
+    coverage, costs = small_game
+    reducer = CriteriaReducer(DefenderCriteria.LAPLACE_REASON, 10, 63)
+
+    with pytest.raises(ValueError):
+        racing.racing(coverage, costs, DefenderCriteria.WALD_MAXIMIN, reducer, 10)
+    with pytest.raises(ValueError):
+        racing.racing(coverage, costs, DefenderCriteria.LAPLACE_REASON, reducer, 10, k=0)
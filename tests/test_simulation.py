@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+import parallel
+import simulation
+from coverage import CoverageIndex
+from criteria import CriteriaReducer
+from maths import CombinationGenerator
+from projectsharablestate import DefenderCriteria
+
+N_SIMULATIONS = 4000
+
+
+def laplace(engine, coverage, costs, **kwargs):
+    reducer = CriteriaReducer(DefenderCriteria.LAPLACE_REASON, N_SIMULATIONS, 2 ** coverage.n_mitigations - 1)
+    engine(coverage, costs, N_SIMULATIONS, seed=1, reducer=reducer, keep_matrix=False, **kwargs)
+    return reducer.values
+
+
+@pytest.mark.parametrize("engine, kwargs", [
+    (simulation.monte_carlo, {}),
+    (simulation.common_monte_carlo, {}),
+    (simulation.common_monte_carlo, {"sobol": True}),
+])
+def test_monte_carlo_converges_to_exact_laplace(engine, kwargs, small_game, exact_payoffs):
+    coverage, costs = small_game
+    exact = exact_payoffs.mean(axis=1)
+    # Five standard errors of every column mean
+    tolerance = 5 * exact_payoffs.std(axis=1) / np.sqrt(N_SIMULATIONS) + 1e-9
+
+    values = laplace(engine, coverage, costs, **kwargs)
+
+    assert (np.abs(values.filled(0) - exact) <= tolerance).all()
+
+
+@pytest.mark.parametrize("engine", [simulation.monte_carlo, simulation.common_monte_carlo])
+def test_sparse_matrix_matches_dense(engine, small_game):
+    coverage, costs = small_game
+
+    dense = engine(coverage, costs, 50, seed=2)
+    sparse = engine(coverage, costs, 50, seed=2, sparse_output=True)
+
+    assert (sparse.toarray() == dense).all()
+
+
+@pytest.mark.parametrize("criteria", list(DefenderCriteria))
+def test_parallel_matches_serial(criteria):
+    matrix = np.random.default_rng(1).random((9, 30)) < 0.2
+    relations = {f"m{m}": [f"t{t}" for t in np.flatnonzero(row)] for m, row in enumerate(matrix)}
+    coverage = CoverageIndex([f"m{m}" for m in range(9)], [f"t{t}" for t in range(30)], relations)
+    costs = np.arange(1.0, 10.0)
+    serial = CriteriaReducer(criteria, 20, 2 ** 9 - 1)
+    simulation.monte_carlo(coverage, costs, 20, seed=5, reducer=serial, keep_matrix=False)
+
+    merged = parallel.parallel_monte_carlo(coverage, costs, 20, criteria, seed=5, workers=2,
+                                           shard_size=simulation.COLUMN_CHUNK)
+
+    assert (np.ma.getmaskarray(merged.values) == np.ma.getmaskarray(serial.values)).all()
+    assert (merged.values.filled(0) == serial.values.filled(0)).all()
+    assert merged.top.items() == serial.top.items()
+
+
+def reference_ucb_pulls(coverage, costs, n_simulations, b, seed):
+    """Pulled strategies of steps 1 .. n_simulations - 1, argmin over every radical like the original loop."""
+    total = 2 ** coverage.n_mitigations - 1
+    resolver = CombinationGenerator(range(coverage.n_mitigations))
+    first = np.zeros(total)
+    for lo, block in simulation.iter_monte_carlo(coverage, costs, 1, seed):
+        first[lo:lo + block.shape[1]] = block[0]
+    sums, nonzero, pulls = first.copy(), (first != 0).astype(np.int64), np.ones(total, dtype=np.int64)
+    rng = simulation.sequential_rng(seed)
+    attacks = np.zeros((0, 1))
+    pulled = []
+    for n_yi in range(1, n_simulations):
+        means = np.divide(sums, nonzero, out=np.zeros(total), where=nonzero > 0)
+        radicals = [simulation.calc_radical_ucb(means[j], pulls[j], max(n_yi - 1, 1), b) for j in range(total)]
+        j = int(np.argmin(radicals))
+        pulled.append(j)
+        if len(attacks) == 0:
+            attacks = coverage.pair_counts(simulation.sample_attacks(rng, coverage.n_techniques, (1024,)))
+        mitigated, attacks = attacks[0], attacks[1:]
+        positions = resolver.unrankVaryingLengthCombination(j)
+        value = float(mitigated[positions] @ costs[positions])
+        pulls[j] += 1
+        if value:
+            sums[j] += value
+            nonzero[j] += 1
+    return pulled
+
+
+@pytest.mark.parametrize("b", [0.5, 5, 1000])
+def test_ucb_pulls_match_reference(b, small_game):
+    coverage, costs = small_game
+
+    matrix = simulation.ucb(coverage, costs, 300, b, seed=3)
+
+    # Row 0 holds the initial pull of every strategy, then one pull per row
+    steps = matrix.row >= 1
+    order = np.argsort(matrix.row[steps], kind="stable")
+    assert steps.sum() == 299
+    assert matrix.col[steps][order].tolist() == reference_ucb_pulls(coverage, costs, 300, b, seed=3)
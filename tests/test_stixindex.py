@@ -0,0 +1,48 @@
+import pytest
+from stix2 import Filter, MemoryStore
+
+import stixcache
+import synthetic
+from stixindex import FilterIndex, IndexedStore
+
+OBJECTS = synthetic.generate_bundle(30, 8, 4, 0.2, seed=1)
+MITIGATIONS = [o["id"] for o in OBJECTS if o["type"] == "course-of-action"]
+QUERIES = [
+    None,
+    Filter("type", "=", "attack-pattern"),
+    [Filter("type", "=", "attack-pattern"), Filter("kill_chain_phases.phase_name", "=", "tactic-1")],
+    [Filter("type", "=", "relationship"), Filter("relationship_type", "=", "mitigates")],
+    [Filter("type", "=", "course-of-action"), Filter("id", "in", MITIGATIONS[:3])],
+    Filter("name", "=", "Technique 4"),
+    [Filter("type", "=", "x-mitre-tactic"), Filter("x_mitre_shortname", "in", ["tactic-0", "tactic-3"])],
+    Filter("type", "=", "malware"),
+]
+
+
+def ids(objects):
+    return sorted(o["id"] for o in objects)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_indexed_store_matches_memory_store(query):
+    memory = MemoryStore(stix_data=OBJECTS)
+
+    assert ids(IndexedStore(memory).query(query)) == ids(memory.query(query))
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_cached_store_matches_memory_store(query, tmp_path):
+    synthetic.cache_bundle(OBJECTS, "synthetic-index", tmp_path)
+
+    cached = stixcache.get_source(synthetic.DOMAIN, "synthetic-index", cache_dir=tmp_path, offline=True)
+
+    assert ids(cached.query(query)) == ids(MemoryStore(stix_data=OBJECTS).query(query))
+
+
+def test_filter_index_round_trip(tmp_path):
+    index = FilterIndex.build(OBJECTS)
+    path = str(tmp_path / "filters.json")
+
+    index.save(path)
+
+    assert FilterIndex.load(path).postings == index.postings
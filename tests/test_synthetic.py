@@ -0,0 +1,45 @@
+import benchmarks
+import synthetic
+from projectsharablestate import GameAlgorithm
+
+
+def test_bundle_is_reproducible_and_consistent():
+    objects = synthetic.generate_bundle(40, 6, 5, 0.2, seed=3)
+
+    assert objects == synthetic.generate_bundle(40, 6, 5, 0.2, seed=3)
+    assert objects != synthetic.generate_bundle(40, 6, 5, 0.2, seed=4)
+    by_type = {}
+    for o in objects:
+        by_type.setdefault(o["type"], []).append(o)
+    assert [len(by_type[kind]) for kind in ("x-mitre-tactic", "attack-pattern", "course-of-action")] == [5, 40, 6]
+    assert len({o["id"] for o in objects}) == len(objects)
+    techniques = {o["id"] for o in by_type["attack-pattern"]}
+    mitigations = {o["id"] for o in by_type["course-of-action"]}
+    assert by_type["relationship"]
+    for relationship in by_type["relationship"]:
+        assert relationship["source_ref"] in mitigations and relationship["target_ref"] in techniques
+
+
+def test_project_settings_select_tactics_and_mitigations():
+    objects = synthetic.generate_bundle(40, 6, 5, 0.2, seed=3)
+
+    settings = synthetic.project_settings(objects, "synthetic", n_tactics=2, n_mitigations=4)
+
+    assert len(settings.attacker_tactics) == 2
+    assert [len(app.app_mitigations) for app in settings.defender_apps] == [1, 1, 1, 1]
+
+
+def test_benchmarks_run_offline():
+    lines = []
+
+    results = benchmarks.run([5], 20, 3, 0.2, 5, 1000, repeat=1, seed=0,
+                             only=["unrank", "get-related", GameAlgorithm.Analytic.name, GameAlgorithm.Racing.name],
+                             report=lines.append)
+
+    names = {result["benchmark"] for result in results}
+    assert {"unrank", "unrank-batch", "get-related[graph]", "get-related[memory]",
+            "Analytic[LAPLACE_REASON]", "Racing[LAPLACE_REASON]"} <= names
+    assert len(lines) == len(results) + 1
+    for result in results:
+        assert result["mitigations"] == 5
+        assert result["seconds"] >= 0 and result["peak_bytes"] > 0